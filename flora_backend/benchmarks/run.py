@@ -0,0 +1,313 @@
+# benchmarks/run.py
+
+"""
+Load-test the identify and plant-details endpoints against the local
+PlantNet and GROQ stubs, under WSGI (gunicorn) and/or ASGI (uvicorn), and
+report latency percentiles and throughput per scenario. Run it from
+flora_backend/:
+
+    python -m benchmarks.run --server both
+    python -m benchmarks.run --server asgi --scenarios burst,duplicate --requests 500
+    python -m benchmarks.run --target http://127.0.0.1:8000 --mode wsgi --no-stubs
+
+Scenarios:
+    single     one request at a time, every image new (pure per-request latency)
+    burst      every request released at once, every image new
+    batch      /api/identify/batch/ with --batch-size new images per request
+    duplicate  most requests reuse a few images (cache hits, coalescing)
+    details    plant-details for a skewed mix of species names
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from .stubs import add_stub_arguments, load_species
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ("single", "burst", "batch", "duplicate", "details")
+
+SERVER_COMMANDS = {
+    "wsgi": [
+        sys.executable, "-m", "gunicorn", "flora_backend.wsgi:application",
+        "--bind", "{host}:{port}", "--workers", "{workers}",
+        "--worker-class", "gthread", "--threads", "{threads}", "--log-level", "warning",
+    ],
+    "asgi": [
+        sys.executable, "-m", "uvicorn", "flora_backend.asgi:application",
+        "--host", "{host}", "--port", "{port}", "--workers", "{workers}", "--log-level", "warning",
+    ],
+}
+
+# The async views only exist for identify and plant-details; batch is sync everywhere
+PATHS = {
+    "wsgi": {"identify": "/api/identify/", "details": "/api/plant-details/", "batch": "/api/identify/batch/"},
+    "asgi": {"identify": "/api/async/identify/", "details": "/api/async/plant-details/", "batch": "/api/identify/batch/"},
+}
+
+
+def make_images(count, size=(640, 480)):
+    """count distinct JPEGs of random noise, so none of them share a cache entry"""
+    from PIL import Image
+
+    images = []
+    for _ in range(count):
+        image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=80)
+        images.append(buffer.getvalue())
+    return images
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values) + 0.5))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(mode, scenario, samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        "mode": mode,
+        "scenario": scenario,
+        "requests": len(samples),
+        "ok": ok,
+        "errors": len(samples) - ok,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    }
+
+
+def build_requests(scenario, paths, args, species):
+    """(method, path, httpx request kwargs) for every request of a scenario"""
+    if scenario in ("single", "burst"):
+        return [
+            ("POST", paths["identify"], {"files": {"image": ("plant.jpg", image, "image/jpeg")}})
+            for image in make_images(args.requests)
+        ]
+    if scenario == "batch":
+        count = max(1, args.requests // args.batch_size)
+        images = make_images(count * args.batch_size)
+        return [
+            ("POST", paths["batch"], {"files": [
+                ("images", (f"plant{j}.jpg", image, "image/jpeg"))
+                for j, image in enumerate(images[i * args.batch_size:(i + 1) * args.batch_size])
+            ]})
+            for i in range(count)
+        ]
+    if scenario == "duplicate":
+        popular = make_images(args.duplicate_pool)
+        fresh = iter(make_images(args.requests))
+        return [
+            ("POST", paths["identify"], {"files": {"image": (
+                "plant.jpg",
+                random.choice(popular) if random.random() < args.duplicate_ratio else next(fresh),
+                "image/jpeg",
+            )}})
+            for _ in range(args.requests)
+        ]
+    if scenario == "details":
+        # Zipf-like: a few species get most of the traffic, like real identifications
+        weights = [1 / rank for rank in range(1, len(species) + 1)]
+        names = random.choices([name for name, _ in species], weights=weights, k=args.requests)
+        return [("POST", paths["details"], {"json": {"plant_name": name}}) for name in names]
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def run_requests(base_url, requests, concurrency, timeout):
+    """Send requests with at most concurrency in flight; returns ([(latency, status)], elapsed)"""
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def send(method, path, kwargs):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                samples.append((time.perf_counter() - start, status))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(method, path, kwargs) for method, path, kwargs in requests))
+        elapsed = time.perf_counter() - start
+    return samples, elapsed
+
+
+def run_scenario(base_url, mode, scenario, args, species):
+    requests = build_requests(scenario, PATHS[mode], args, species)
+    concurrency = 1 if scenario == "single" else len(requests) if scenario == "burst" else args.concurrency
+    samples, elapsed = asyncio.run(run_requests(base_url, requests, concurrency, args.timeout))
+    return summarize(mode, scenario, samples, elapsed)
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            httpx.get(f"{base_url}/api/species/?q=ro", timeout=2)
+            return True
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    return False
+
+
+def server_env(args, state_dir):
+    """The backend's environment: stub upstreams, and state files that start empty"""
+    env = dict(os.environ)
+    env.update({
+        "PLANTNET_API_KEY": env.get("BENCHMARK_PLANTNET_API_KEY", "benchmark"),
+        "PLANTNET_API_URL": f"http://127.0.0.1:{args.plantnet_port}",
+        "GROQ_API_KEY": env.get("BENCHMARK_GROQ_API_KEY", "benchmark"),
+        "GROQ_API_URL": f"http://127.0.0.1:{args.groq_port}",
+        "IDENTIFY_CACHE_SQLITE_PATH": str(Path(state_dir) / "identify-cache.sqlite3"),
+        "DETAILS_CACHE_SQLITE_PATH": str(Path(state_dir) / "details-cache.sqlite3"),
+        "RATE_LIMIT_SQLITE_PATH": str(Path(state_dir) / "ratelimit.sqlite3"),
+    })
+    if not args.persist:
+        env["IDENTIFY_PERSIST"] = "False"
+    return env
+
+
+def start_server(mode, args, state_dir, extra_env=None):
+    command = [
+        part.format(host="127.0.0.1", port=args.port, workers=args.workers, threads=args.threads)
+        for part in SERVER_COMMANDS[mode]
+    ]
+    env = server_env(args, state_dir)
+    env.update(extra_env or {})
+    log = open(Path(state_dir) / f"{mode}.log", "wb")
+    return subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop(process):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def start_stubs(args):
+    command = [
+        sys.executable, "-m", "benchmarks.stubs",
+        "--plantnet-port", str(args.plantnet_port), "--groq-port", str(args.groq_port),
+        "--plantnet-latency", str(args.plantnet_latency), "--groq-latency", str(args.groq_latency),
+        "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+        "--error-status", str(args.error_status),
+    ]
+    if args.retry_after is not None:
+        command += ["--retry-after", str(args.retry_after)]
+    process = subprocess.Popen(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            httpx.post(f"http://127.0.0.1:{args.groq_port}/", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    stop(process)
+    raise SystemExit("Stub servers did not start")
+
+
+def print_table(results):
+    columns = ("mode", "scenario", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    rows = [columns] + [tuple(str(result[column]) for column in columns) for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FLORA's endpoints against local upstream stubs")
+    parser.add_argument("--server", choices=("wsgi", "asgi", "both"), default="both",
+                        help="Start the backend under gunicorn, uvicorn or each in turn (default both)")
+    parser.add_argument("--target", help="Benchmark an already running backend at this URL instead")
+    parser.add_argument("--mode", choices=("wsgi", "asgi"), default="wsgi",
+                        help="Endpoints to use with --target: sync or /api/async/ (default wsgi)")
+    parser.add_argument("--no-stubs", action="store_true", help="Don't start the stub servers")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated (default all)")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario (default 200)")
+    parser.add_argument("--concurrency", type=int, default=32, help="In-flight requests for batch, duplicate and details")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per batch request (default 8)")
+    parser.add_argument("--duplicate-pool", type=int, default=5, help="Popular images in the duplicate scenario")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.9, help="Share of duplicate requests (default 0.9)")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--port", type=int, default=8100, help="Port for the started backend (default 8100)")
+    parser.add_argument("--workers", type=int, default=4, help="Server processes (default 4)")
+    parser.add_argument("--threads", type=int, default=8, help="Threads per gunicorn worker (default 8)")
+    parser.add_argument("--persist", action="store_true",
+                        help="Store identifications as usual (writes to the configured database and MEDIA_ROOT)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    species = load_species()
+    modes = [args.mode] if args.target else ["wsgi", "asgi"] if args.server == "both" else [args.server]
+
+    stubs = None if args.no_stubs else start_stubs(args)
+    results = []
+    try:
+        for mode in modes:
+            # Each server gets its own caches and rate-limit state, so one mode
+            # never starts warm from the run before it
+            state_dir = tempfile.mkdtemp(prefix=f"flora-bench-{mode}-")
+            server = None
+            base_url = args.target.rstrip("/") if args.target else f"http://127.0.0.1:{args.port}"
+            if not args.target:
+                server = start_server(mode, args, state_dir)
+            try:
+                if not wait_until_ready(base_url, server):
+                    log = Path(state_dir) / f"{mode}.log"
+                    tail = log.read_text(errors="replace")[-2000:] if log.exists() else ""
+                    raise SystemExit(f"{mode} server did not come up on {base_url}\n{tail}")
+                for scenario in scenarios:
+                    print(f"{mode}: {scenario}...", file=sys.stderr)
+                    results.append(run_scenario(base_url, mode, scenario, args, species))
+            finally:
+                stop(server)
+                shutil.rmtree(state_dir, ignore_errors=True)
+    finally:
+        stop(stubs)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# benchmarks/startup.py
+
+"""
+Measure how long a fresh worker takes to start and how slow its first
+requests are, with WARM_UP on and off, under WSGI (gunicorn) and/or ASGI
+(uvicorn) against the local PlantNet and GROQ stubs. Every run starts a new
+single-worker server with empty caches. Run it from flora_backend/:
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --server wsgi --warm-up on --imports 25
+
+Reported per server and warm-up setting (medians over the runs):
+    ready_ms            process start until the worker answers a request
+    first_details_ms    the worker's first plant-details lookup (a GROQ call)
+    second_details_ms   the next one, for a different plant
+    first_identify_ms   the first identification
+    second_identify_ms  the next one
+Requests go one at a time, --pause seconds apart, so the details prefetch an
+identification starts in the background doesn't land in the next timing.
+--imports N also prints the N slowest imports of django.setup() plus warm_up().
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from .run import BASE_DIR, PATHS, make_images, server_env, start_server, start_stubs, stop
+from .stubs import add_stub_arguments
+
+COLUMNS = ("first_details_ms", "second_details_ms", "first_identify_ms", "second_identify_ms")
+# Django answers an unknown path with 404 once the worker is serving
+PROBE_PATH = "/startup-probe/"
+
+IMPORT_SCRIPT = """
+import os, django
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "flora_backend.settings")
+django.setup()
+from main.warmup import warm_up
+warm_up()
+"""
+
+
+def wait_for_worker(client, process, started, timeout=60):
+    """Seconds from started until the server answers the probe, or None if it never does"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return None
+        try:
+            client.get(PROBE_PATH)
+            return time.perf_counter() - started
+        except httpx.HTTPError:
+            time.sleep(0.01)
+    return None
+
+
+def timed_request(client, pause, method, path, **kwargs):
+    time.sleep(pause)
+    started = time.perf_counter()
+    response = client.request(method, path, **kwargs)
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        raise SystemExit(f"{method} {path} failed with {response.status_code}: {response.text[:500]}")
+    return elapsed
+
+
+def measure(mode, warm_up, run, args):
+    """Start one server and time its readiness and first requests; returns ms per column"""
+    state_dir = tempfile.mkdtemp(prefix="flora-startup-")
+    args.workers = 1
+    paths = PATHS[mode]
+    images = make_images(2)
+    # Names outside the precomputed details store, so both lookups go to GROQ
+    names = [f"Startup benchmark plant {run}-{i}" for i in range(2)]
+    started = time.perf_counter()
+    server = start_server(mode, args, state_dir, {"WARM_UP": "True" if warm_up else "False"})
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout) as client:
+            ready = wait_for_worker(client, server, started)
+            if ready is None:
+                log = Path(state_dir) / f"{mode}.log"
+                tail = log.read_text(errors="replace")[-2000:] if log.exists() else ""
+                raise SystemExit(f"{mode} server did not come up\n{tail}")
+            timings = [ready]
+            for name in names:
+                timings.append(timed_request(client, args.pause, "POST", paths["details"], json={"plant_name": name}))
+            for image in images:
+                timings.append(timed_request(
+                    client, args.pause, "POST", paths["identify"],
+                    files={"image": ("plant.jpg", image, "image/jpeg")},
+                ))
+    finally:
+        stop(server)
+        shutil.rmtree(state_dir, ignore_errors=True)
+    return dict(zip(("ready_ms",) + COLUMNS, (round(seconds * 1000, 1) for seconds in timings)))
+
+
+def summarize(mode, warm_up, samples):
+    result = {"mode": mode, "warm_up": "on" if warm_up else "off", "runs": len(samples)}
+    for column in ("ready_ms",) + COLUMNS:
+        result[column] = round(statistics.median(sample[column] for sample in samples), 1)
+    return result
+
+
+def print_table(results):
+    columns = ("mode", "warm_up", "runs", "ready_ms") + COLUMNS
+    rows = [columns] + [tuple(str(result[column]) for column in columns) for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def print_imports(args, count):
+    """The slowest imports of a worker's startup, by time spent in the module itself"""
+    state_dir = tempfile.mkdtemp(prefix="flora-startup-")
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT],
+            cwd=BASE_DIR, env=server_env(args, state_dir), capture_output=True, text=True,
+        )
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        imports.append((int(own), int(cumulative), name.strip()))
+    total = sum(own for own, _, _ in imports)
+    print(f"\n{len(imports)} modules imported in {total / 1000:.0f}ms; slowest by own time:")
+    for own, cumulative, name in sorted(imports, reverse=True)[:count]:
+        print(f"  {own / 1000:8.1f}ms  {cumulative / 1000:8.1f}ms cumulative  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure FLORA's worker startup and first-request latency")
+    parser.add_argument("--server", choices=("wsgi", "asgi", "both"), default="both",
+                        help="Start the backend under gunicorn, uvicorn or each in turn (default both)")
+    parser.add_argument("--warm-up", choices=("on", "off", "both"), default="both",
+                        help="WARM_UP setting to compare (default both)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh servers per combination (default 5)")
+    parser.add_argument("--port", type=int, default=8100, help="Port for the started backend (default 8100)")
+    parser.add_argument("--threads", type=int, default=8, help="Threads per gunicorn worker (default 8)")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--pause", type=float, default=0.5, help="Seconds between requests (default 0.5)")
+    parser.add_argument("--imports", type=int, default=0, metavar="N",
+                        help="Also list the N slowest imports of a worker's startup")
+    parser.add_argument("--json", help="Also write the results to this file")
+    add_stub_arguments(parser)
+    # Upstream latency only adds the same constant to every request here
+    parser.set_defaults(plantnet_latency=0.0, groq_latency=0.0, jitter=0.0)
+    args = parser.parse_args()
+    args.persist = False
+
+    modes = ["wsgi", "asgi"] if args.server == "both" else [args.server]
+    warm_ups = [True, False] if args.warm_up == "both" else [args.warm_up == "on"]
+
+    stubs = start_stubs(args)
+    results = []
+    try:
+        for mode in modes:
+            for warm_up in warm_ups:
+                print(f"{mode}, warm-up {'on' if warm_up else 'off'}...", file=sys.stderr)
+                samples = [measure(mode, warm_up, run, args) for run in range(args.runs)]
+                results.append(summarize(mode, warm_up, samples))
+    finally:
+        stop(stubs)
+
+    print_table(results)
+    if args.imports:
+        print_imports(args, args.imports)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# benchmarks/stubs.py
+
+"""
+Local stand-ins for PlantNet (/v2/identify/<project>) and the GROQ
+chat-completions API, with configurable latency and error rates, so the
+backend can be load-tested without spending API quota. Point the backend
+at them with PLANTNET_API_URL and GROQ_API_URL.
+
+    python -m benchmarks.stubs --plantnet-latency 0.4 --groq-latency 1.5 --error-rate 0.01
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SPECIES_SOURCE = Path(__file__).resolve().parent.parent / "main" / "data" / "species.tsv"
+
+
+def load_species(path=SPECIES_SOURCE, limit=50):
+    """(scientific_name, common_names) pairs to answer with"""
+    species = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            columns = line.rstrip("\n").split("\t") + [""]
+            common_names = [n.strip() for n in columns[1].split(";") if n.strip()]
+            species.append((columns[0].strip(), common_names))
+            if len(species) >= limit:
+                break
+    return species
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, retry_after=None):
+        super().__init__(address, handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.calls = 0
+        self.species = load_species()
+
+    def delay(self):
+        """One call's latency: the base latency +/- up to jitter of it"""
+        return max(0.0, self.latency * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status >= 400 and self.server.retry_after is not None:
+            self.send_header("Retry-After", str(self.server.retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PlantNetHandler(StubHandler):
+    """Answers every identification with five (or nb-results) species picked from the image bytes"""
+
+    def do_POST(self):
+        body = self.read_body()
+        if not self.path.startswith("/v2/identify/"):
+            return self.send_json({"message": "Not found"}, 404)
+        self.server.calls += 1
+        time.sleep(self.server.delay())
+        if self.server.should_fail():
+            return self.send_json({"message": "Stub failure"}, self.server.error_status)
+
+        # The same image always gets the same answer
+        species = self.server.species
+        start = int(hashlib.sha256(body).hexdigest(), 16) % len(species)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        count = int(query.get("nb-results", ["5"])[0])
+        picked = [species[(start + i) % len(species)] for i in range(min(count, len(species)))]
+        results = [
+            {
+                "score": round(0.8 / (i + 1), 5),
+                "species": {
+                    "scientificNameWithoutAuthor": name,
+                    "scientificName": name,
+                    "commonNames": common_names,
+                },
+            }
+            for i, (name, common_names) in enumerate(picked)
+        ]
+        self.send_json({"bestMatch": picked[0][0], "results": results, "remainingIdentificationRequests": 500})
+
+
+def details_for(plant_name):
+    return {
+        "introduction": f"{plant_name} is a plant used for load testing.",
+        "history": f"{plant_name} has been answered by the FLORA benchmark stub since it started.",
+        "facts": [f"Fact {i} about {plant_name}." for i in range(1, 4)],
+        "usage": [f"Use {i} of {plant_name}." for i in range(1, 4)],
+    }
+
+
+class GroqHandler(StubHandler):
+    """OpenAI-style chat completions, streamed or not, with JSON plant details as content"""
+
+    def do_POST(self):
+        body = self.read_body()
+        if not self.path.endswith("/chat/completions"):
+            return self.send_json({"error": {"message": "Not found"}}, 404)
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return self.send_json({"error": {"message": "Invalid JSON"}}, 400)
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        plant_name = prompt.removeprefix("Tell me about ").strip() or "this plant"
+        content = json.dumps(details_for(plant_name))
+        delay = self.server.delay()
+        if self.server.should_fail():
+            time.sleep(delay)
+            return self.send_json({"error": {"message": "Stub failure"}}, self.server.error_status)
+
+        completion = {
+            "id": f"stub-{random.getrandbits(32):08x}",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+        }
+        if not request.get("stream"):
+            time.sleep(delay)
+            return self.send_json({
+                **completion,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(content) // 4, "total_tokens": 100 + len(content) // 4},
+            })
+
+        # The latency is spread over the stream like token generation
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            chunk = {
+                **completion,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def start_stubs(host="127.0.0.1", plantnet_port=8765, groq_port=8766, **options):
+    """
+    Serve both stubs on background threads. options are per-stub overrides
+    (plantnet_latency, groq_error_rate, ...) or shared ones (jitter,
+    error_rate, error_status). Returns the two servers.
+    """
+    servers = []
+    for name, handler, port in (("plantnet", PlantNetHandler, plantnet_port), ("groq", GroqHandler, groq_port)):
+        settings = {
+            key: options[key] for key in ("jitter", "error_rate", "error_status", "retry_after") if key in options
+        }
+        settings.update({
+            key[len(name) + 1:]: value for key, value in options.items() if key.startswith(f"{name}_")
+        })
+        server = StubServer((host, port), handler, **settings)
+        threading.Thread(target=server.serve_forever, name=f"{name}-stub", daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--plantnet-latency", type=float, default=0.4, help="Seconds per PlantNet call (default 0.4)")
+    parser.add_argument("--groq-latency", type=float, default=1.5, help="Seconds per GROQ completion (default 1.5)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency varies by up to this fraction (default 0.2)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls that fail (default 0)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status code of failed calls (default 503)")
+    parser.add_argument("--retry-after", type=int, help="Retry-After seconds sent with failed calls (default none)")
+    parser.add_argument("--plantnet-port", type=int, default=8765)
+    parser.add_argument("--groq-port", type=int, default=8766)
+
+
+def stub_options(args):
+    return {
+        "plantnet_latency": args.plantnet_latency,
+        "groq_latency": args.groq_latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "retry_after": args.retry_after,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PlantNet and GROQ stub servers for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    start_stubs(args.host, args.plantnet_port, args.groq_port, **stub_options(args))
+    print(f"PlantNet stub: PLANTNET_API_URL=http://{args.host}:{args.plantnet_port}")
+    print(f"GROQ stub:     GROQ_API_URL=http://{args.host}:{args.groq_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -14,3 +14,23 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flora_backend.settings')
 
 application = get_asgi_application()
+
+# Turn away oversized uploads before Django buffers the body
+from main.uploads import limit_request_body  # noqa: E402
+
+application = limit_request_body(application)
+
+# Imported once per worker after the fork: build clients and caches before the
+# first request, and the loop-bound async clients at lifespan startup
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_UP:
+    from main.warmup import lifespan_warm_up, warm_up
+
+    warm_up(asynchronous=True)
+    application = lifespan_warm_up(application)
+
+# Pick up queued jobs left by the previous process without waiting for an upload
+from main.jobs import start_local_worker  # noqa: E402
+
+start_local_worker()
@@ -4,13 +4,18 @@ Django settings for flora_backend project.
 
 from pathlib import Path
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Local development reads flora_backend/.env; deployments set real environment
+# variables and skip both the dotenv import and its search for the file
+if (BASE_DIR / '.env').is_file():
+    from dotenv import load_dotenv
+
+    load_dotenv(BASE_DIR / '.env')
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = "django-insecure-n66lxtzxl=dx!by#k3ef!fty*&l16x4^!a%p+4g*u3if$zo)bn"
 
@@ -34,6 +39,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware must come first
+    'main.middleware.MetricsMiddleware',
+    'main.middleware.CompressionMiddleware',
+    'main.uploads.UploadLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,12 +104,67 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'flora_backend.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database: SQLite for a single node (default), or DB_ENGINE=postgres (needs
+# `pip install "psycopg[binary,pool]"`) when several app nodes share one database
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+# Seconds a connection is kept open between requests (0 = one per request);
+# health checks replace connections that died while idle
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'flora'),
+            'USER': os.getenv('DB_USER', 'flora'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+                'sslmode': os.getenv('DB_SSLMODE', 'prefer'),
+            },
+        }
     }
-}
+    # psycopg connection pool per process, the better choice under ASGI where
+    # persistent connections aren't reused across requests. Replaces
+    # CONN_MAX_AGE, which Django doesn't allow together with a pool
+    if os.getenv('DB_POOL', 'False') == 'True':
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+            'OPTIONS': {
+                # WAL lets reads run alongside the single writer. IMMEDIATE
+                # transactions take the write lock up front, so concurrent
+                # writers wait up to `timeout` seconds instead of failing
+                # with "database is locked" halfway through
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': float(os.getenv('SQLITE_TIMEOUT', 20)),
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE {DB_ENGINE!r}: use 'sqlite' or 'postgres'")
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -127,9 +190,60 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 
-# Media files
-MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
+# Media files. In production put MEDIA_URL on the web server or a CDN (Django
+# only serves it with DEBUG on); see "Media storage" in the README
+MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+
+# Where uploaded images are stored: 'local' (MEDIA_ROOT), 'hashed' (MEDIA_ROOT,
+# named by content hash so repeated uploads are stored once) or 's3' (any
+# S3-compatible API; needs `pip install "django-storages[s3]"`)
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'local')
+MEDIA_STORAGE_BACKENDS = {
+    'local': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'hashed': {'BACKEND': 'main.media.ContentAddressedStorage'},
+    's3': {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.getenv('MEDIA_S3_BUCKET'),
+            'endpoint_url': os.getenv('MEDIA_S3_ENDPOINT_URL'),  # e.g. a local MinIO
+            'access_key': os.getenv('MEDIA_S3_ACCESS_KEY'),
+            'secret_key': os.getenv('MEDIA_S3_SECRET_KEY'),
+            'region_name': os.getenv('MEDIA_S3_REGION'),
+            'custom_domain': os.getenv('MEDIA_S3_CUSTOM_DOMAIN'),  # CDN in front of the bucket
+            'querystring_auth': os.getenv('MEDIA_S3_SIGNED_URLS', 'True') == 'True',
+            'addressing_style': os.getenv('MEDIA_S3_ADDRESSING_STYLE'),
+            'file_overwrite': False,
+        },
+    },
+}
+if MEDIA_STORAGE not in MEDIA_STORAGE_BACKENDS:
+    raise ImproperlyConfigured(f"Unknown MEDIA_STORAGE {MEDIA_STORAGE!r}: use 'local', 'hashed' or 's3'")
+STORAGES = {
+    'default': MEDIA_STORAGE_BACKENDS[MEDIA_STORAGE],
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Thumbnails stored next to each identification's image (0 = none)
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', 320))  # longest edge in pixels
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'JPEG').upper()
+if THUMBNAIL_FORMAT not in ('JPEG', 'WEBP'):
+    raise ImproperlyConfigured(f"Unknown THUMBNAIL_FORMAT {THUMBNAIL_FORMAT!r}: use 'JPEG' or 'WEBP'")
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 80))
+
+# Uploads up to this size stay in memory and are forwarded to PlantNet from their
+# buffer; larger ones are spooled to a temporary file by Django
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 10 * 1024 * 1024))
+
+# Requests over UPLOAD_MAX_REQUEST_SIZE bytes are rejected with 413 before their
+# body is read, and parsing stops at the first file over UPLOAD_MAX_FILE_SIZE
+UPLOAD_MAX_REQUEST_SIZE = int(os.getenv('UPLOAD_MAX_REQUEST_SIZE', 100 * 1024 * 1024))
+UPLOAD_MAX_FILE_SIZE = int(os.getenv('UPLOAD_MAX_FILE_SIZE', 20 * 1024 * 1024))
+FILE_UPLOAD_HANDLERS = [
+    'main.uploads.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -137,5 +251,140 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # PlantNet API Key
 PLANTNET_API_KEY = os.getenv('PLANTNET_API_KEY')
 
+# PlantNet client (one keep-alive session per process)
+PLANTNET_API_URL = os.getenv('PLANTNET_API_URL', 'https://my-api.plantnet.org')
+PLANTNET_POOL_SIZE = int(os.getenv('PLANTNET_POOL_SIZE', 10))
+PLANTNET_CONNECT_TIMEOUT = float(os.getenv('PLANTNET_CONNECT_TIMEOUT', 3.05))
+PLANTNET_READ_TIMEOUT = float(os.getenv('PLANTNET_READ_TIMEOUT', 30))
+PLANTNET_MAX_RETRIES = int(os.getenv('PLANTNET_MAX_RETRIES', 2))
+PLANTNET_RETRY_BACKOFF = float(os.getenv('PLANTNET_RETRY_BACKOFF', 0.5))
+# Longest wait between retries, even when PlantNet's Retry-After asks for more
+PLANTNET_RETRY_MAX_BACKOFF = float(os.getenv('PLANTNET_RETRY_MAX_BACKOFF', 5))
+
+# Identification backends, asked in order until one is confident: 'plantnet',
+# 'local' (on-box ONNX classifier) or a dotted path to a backend class.
+# e.g. IDENTIFY_BACKENDS=local,plantnet answers common species locally
+IDENTIFY_BACKENDS = [name.strip() for name in os.getenv('IDENTIFY_BACKENDS', 'plantnet').split(',') if name.strip()]
+# Answer with a less confident earlier result when a later backend fails
+IDENTIFY_BACKENDS_FALLBACK = os.getenv('IDENTIFY_BACKENDS_FALLBACK', 'True') == 'True'
+
+# PlantNet candidates kept per identification (0 = all); also sent to PlantNet
+# as nb-results so the extra ones are never sent or parsed
+IDENTIFY_TOP_K = int(os.getenv('IDENTIFY_TOP_K', 0))
+# PlantNet candidates scoring below this are dropped; the best one is always kept
+IDENTIFY_MIN_SCORE = float(os.getenv('IDENTIFY_MIN_SCORE', 0))
+# A best score below this marks the identification low_confidence: the app
+# asks for another photo and no plant details are looked up (0 = off)
+IDENTIFY_LOW_CONFIDENCE_SCORE = float(os.getenv('IDENTIFY_LOW_CONFIDENCE_SCORE', 0))
+
+# Local classifier (needs onnxruntime and numpy): an ONNX model taking a
+# normalized NCHW RGB batch and a JSON list of labels in output order
+LOCAL_CLASSIFIER_MODEL = os.getenv('LOCAL_CLASSIFIER_MODEL')
+LOCAL_CLASSIFIER_LABELS = os.getenv('LOCAL_CLASSIFIER_LABELS')
+LOCAL_CLASSIFIER_INPUT_SIZE = int(os.getenv('LOCAL_CLASSIFIER_INPUT_SIZE', 224))
+LOCAL_CLASSIFIER_TOP_K = int(os.getenv('LOCAL_CLASSIFIER_TOP_K', 5))
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv('LOCAL_CLASSIFIER_MIN_CONFIDENCE', 0.85))
+LOCAL_CLASSIFIER_WORKERS = int(os.getenv('LOCAL_CLASSIFIER_WORKERS', 2))  # processes
+
+# Store every identification as an IdentifiedPlant row, by default on a
+# background write-behind queue so responses don't wait for the write
+IDENTIFY_PERSIST = os.getenv('IDENTIFY_PERSIST', 'True') == 'True'
+IDENTIFY_PERSIST_ASYNC = os.getenv('IDENTIFY_PERSIST_ASYNC', 'True') == 'True'
+# Queued rows hold their image in memory: cap the queue by rows and by bytes
+IDENTIFY_PERSIST_QUEUE_SIZE = int(os.getenv('IDENTIFY_PERSIST_QUEUE_SIZE', 200))
+IDENTIFY_PERSIST_QUEUE_BYTES = int(os.getenv('IDENTIFY_PERSIST_QUEUE_BYTES', 64 * 1024 * 1024))
+
+# Batch identification (/api/identify/batch/)
+IDENTIFY_BATCH_MAX_IMAGES = int(os.getenv('IDENTIFY_BATCH_MAX_IMAGES', 50))
+IDENTIFY_BATCH_WORKERS = int(os.getenv('IDENTIFY_BATCH_WORKERS', 8))
+
+# Queued identifications (queue=true). Jobs live in the IdentifiedPlant table;
+# run them in the web process or with `manage.py run_identification_worker`
+IDENTIFY_JOBS_IN_PROCESS = os.getenv('IDENTIFY_JOBS_IN_PROCESS', 'True') == 'True'
+IDENTIFY_JOB_CONCURRENCY = int(os.getenv('IDENTIFY_JOB_CONCURRENCY', 4))
+IDENTIFY_JOB_POLL_INTERVAL = float(os.getenv('IDENTIFY_JOB_POLL_INTERVAL', 1.0))
+IDENTIFY_JOB_MAX_ATTEMPTS = int(os.getenv('IDENTIFY_JOB_MAX_ATTEMPTS', 3))
+IDENTIFY_JOB_TIMEOUT = int(os.getenv('IDENTIFY_JOB_TIMEOUT', 300))  # seconds before a running job is requeued
+IDENTIFY_JOB_RETRY_BACKOFF = float(os.getenv('IDENTIFY_JOB_RETRY_BACKOFF', 5))  # seconds before the first retry, doubling
+IDENTIFY_JOB_CALLBACK_TIMEOUT = float(os.getenv('IDENTIFY_JOB_CALLBACK_TIMEOUT', 10))
+# Hosts callback_url may point at; when empty, any host with only public addresses
+IDENTIFY_JOB_CALLBACK_HOSTS = [host.strip().lower() for host in os.getenv('IDENTIFY_JOB_CALLBACK_HOSTS', '').split(',') if host.strip()]
+
+# Upstream governor. Calls per second per API key (0 = no limit), shared by
+# all processes on the host through RATE_LIMIT_SQLITE_PATH ('local' limits
+# each process on its own); a call waits up to *_RATE_LIMIT_WAIT seconds for
+# its turn before it is rejected with 429
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'sqlite')
+RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH', BASE_DIR / 'ratelimit.sqlite3')
+PLANTNET_RATE_LIMIT = float(os.getenv('PLANTNET_RATE_LIMIT', 0))
+PLANTNET_RATE_LIMIT_BURST = int(os.getenv('PLANTNET_RATE_LIMIT_BURST', 0))  # 0 = one second's worth
+PLANTNET_RATE_LIMIT_WAIT = float(os.getenv('PLANTNET_RATE_LIMIT_WAIT', 2))
+GROQ_RATE_LIMIT = float(os.getenv('GROQ_RATE_LIMIT', 0))
+GROQ_RATE_LIMIT_BURST = int(os.getenv('GROQ_RATE_LIMIT_BURST', 0))
+GROQ_RATE_LIMIT_WAIT = float(os.getenv('GROQ_RATE_LIMIT_WAIT', 2))
+# Circuit breaker: after this many consecutive upstream failures (0 = off),
+# calls fail fast with 503 for *_BREAKER_RESET seconds
+PLANTNET_BREAKER_THRESHOLD = int(os.getenv('PLANTNET_BREAKER_THRESHOLD', 5))
+PLANTNET_BREAKER_RESET = float(os.getenv('PLANTNET_BREAKER_RESET', 30))
+GROQ_BREAKER_THRESHOLD = int(os.getenv('GROQ_BREAKER_THRESHOLD', 5))
+GROQ_BREAKER_RESET = float(os.getenv('GROQ_BREAKER_RESET', 30))
+
+# Max in-flight upstream calls per ASGI worker (async views)
+PLANTNET_MAX_CONCURRENCY = int(os.getenv('PLANTNET_MAX_CONCURRENCY', 32))
+GROQ_MAX_CONCURRENCY = int(os.getenv('GROQ_MAX_CONCURRENCY', 16))
+
+# Optional downscale/re-encode of uploads before they are sent to PlantNet
+IMAGE_PREPROCESSING = os.getenv('IMAGE_PREPROCESSING', 'False') == 'True'
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', 1280))
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'JPEG').upper()
+if IMAGE_FORMAT not in ('JPEG', 'WEBP'):
+    raise ImproperlyConfigured(f"Unknown IMAGE_FORMAT {IMAGE_FORMAT!r}: use 'JPEG' or 'WEBP'")
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 85))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv('IMAGE_PREPROCESS_WORKERS', 0))  # 0 = one per CPU
+
 # GROQ API Key
-GROQ_API_KEY = os.getenv('GROQ_API_KEY')
\ No newline at end of file
+GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+GROQ_TIMEOUT = float(os.getenv('GROQ_TIMEOUT', 60))
+GROQ_API_URL = os.getenv('GROQ_API_URL')  # None = GROQ's public API
+
+# Species name index used to canonicalize plant names and for autocomplete;
+# compiled from SPECIES_INDEX_SOURCE on first use or by `manage.py build_species_index`
+SPECIES_INDEX = os.getenv('SPECIES_INDEX', 'True') == 'True'
+SPECIES_INDEX_SOURCE = os.getenv('SPECIES_INDEX_SOURCE', BASE_DIR / 'main' / 'data' / 'species.tsv')
+SPECIES_INDEX_PATH = os.getenv('SPECIES_INDEX_PATH', BASE_DIR / 'species.sqlite3')
+SPECIES_SEARCH_MAX_RESULTS = int(os.getenv('SPECIES_SEARCH_MAX_RESULTS', 50))
+
+# Compact identify responses (compact=true) keep this many candidates unless top_k is given
+COMPACT_TOP_K = int(os.getenv('COMPACT_TOP_K', 3))
+# Cache-Control max-age for plant details; clients and CDNs revalidate with the ETag after it
+DETAILS_HTTP_MAX_AGE = int(os.getenv('DETAILS_HTTP_MAX_AGE', 3600))
+# gzip, or brotli when installed (`pip install brotli`), for responses of at least this many bytes
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'True') == 'True'
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 512))
+
+# Per-process latency histograms and counters, served at /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+
+# Build clients, caches and indexes when each worker starts (see main/warmup.py)
+# rather than on its first request
+WARM_UP = os.getenv('WARM_UP', 'True') == 'True'
+
+# Speculatively warm the details cache for the top N matches of every identification
+DETAILS_PREFETCH_TOP_N = int(os.getenv('DETAILS_PREFETCH_TOP_N', 0))
+DETAILS_PREFETCH_WORKERS = int(os.getenv('DETAILS_PREFETCH_WORKERS', 4))
+
+# Identification cache (keyed on uploaded image content)
+# Backends: 'locmem' (per process), 'django' (CACHES alias), 'sqlite' (shared on host), 'none'
+IDENTIFY_CACHE_BACKEND = os.getenv('IDENTIFY_CACHE_BACKEND', 'locmem')
+IDENTIFY_CACHE_TTL = int(os.getenv('IDENTIFY_CACHE_TTL', 60 * 60 * 24))
+IDENTIFY_CACHE_MAX_ENTRIES = int(os.getenv('IDENTIFY_CACHE_MAX_ENTRIES', 1024))
+IDENTIFY_CACHE_ALIAS = os.getenv('IDENTIFY_CACHE_ALIAS', 'default')
+IDENTIFY_CACHE_SQLITE_PATH = os.getenv('IDENTIFY_CACHE_SQLITE_PATH', BASE_DIR / 'cache.sqlite3')
+IDENTIFY_CACHE_PERCEPTUAL_HASH = os.getenv('IDENTIFY_CACHE_PERCEPTUAL_HASH', 'False') == 'True'
+
+# Plant details cache (keyed on normalized plant name, GROQ model and prompt version)
+DETAILS_CACHE_BACKEND = os.getenv('DETAILS_CACHE_BACKEND', 'sqlite')
+DETAILS_CACHE_TTL = int(os.getenv('DETAILS_CACHE_TTL', 60 * 60 * 24 * 7))
+DETAILS_CACHE_MAX_ENTRIES = int(os.getenv('DETAILS_CACHE_MAX_ENTRIES', 10000))
+DETAILS_CACHE_ALIAS = os.getenv('DETAILS_CACHE_ALIAS', 'default')
+DETAILS_CACHE_SQLITE_PATH = os.getenv('DETAILS_CACHE_SQLITE_PATH', BASE_DIR / 'cache.sqlite3')
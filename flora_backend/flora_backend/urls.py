@@ -3,7 +3,14 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from django.conf import settings
 from django.conf.urls.static import static
-from main.views import IdentifyPlantView, PlantDetailsView
+from main.views import (
+    IdentifyPlantView,
+    PlantDetailsView,
+    SpeciesSearchView,
+    UpstreamStatsView,
+    metrics_view,
+)
+from main import async_views
 
 router = DefaultRouter()
 router.register(r'identify', IdentifyPlantView, basename='identify') 
@@ -12,7 +19,13 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/plant-details/', PlantDetailsView.as_view(), name='plant-details'),
+    path('api/species/', SpeciesSearchView.as_view(), name='species-search'),
+    path('api/upstream-stats/', UpstreamStatsView.as_view(), name='upstream-stats'),
+    # Non-blocking versions for ASGI deployments
+    path('api/async/identify/', async_views.identify_plant, name='async-identify'),
+    path('api/async/plant-details/', async_views.plant_details, name='async-plant-details'),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
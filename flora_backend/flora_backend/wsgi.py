@@ -14,3 +14,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flora_backend.settings')
 
 application = get_wsgi_application()
+
+# Imported once per worker after the fork: build clients and caches before the first request
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_UP:
+    from main.warmup import warm_up
+
+    warm_up()
+
+# Pick up queued jobs left by the previous process without waiting for an upload
+from main.jobs import start_local_worker  # noqa: E402
+
+start_local_worker()
@@ -1,6 +1,12 @@
 from django.contrib import admin
-from .models import IdentifiedPlant
+from .models import IdentifiedPlant, PlantDetails
 
 @admin.register(IdentifiedPlant)
 class IdentifiedPlantAdmin(admin.ModelAdmin):
-    list_display = ['id', 'created_at']
\ No newline at end of file
+    list_display = ['id', 'best_match_scientific_name', 'created_at']
+    show_full_result_count = False  # Skip the extra COUNT(*) on a large table
+
+@admin.register(PlantDetails)
+class PlantDetailsAdmin(admin.ModelAdmin):
+    list_display = ['plant_name', 'updated_at']
+    search_fields = ['plant_name']
@@ -0,0 +1,54 @@
+# main/aio.py
+
+import asyncio
+import threading
+import weakref
+
+from django.conf import settings
+
+
+class LoopLocal:
+    """Lazily creates one object per running event loop (clients and semaphores are loop-bound)"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._objects = weakref.WeakKeyDictionary()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        obj = self._objects.get(loop)
+        if obj is None:
+            obj = self._objects[loop] = self.factory()
+        return obj
+
+
+class UpstreamLimiter:
+    """Caps the number of in-flight calls to one upstream API"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self._semaphores = LoopLocal(lambda: asyncio.Semaphore(limit))
+
+    async def __aenter__(self):
+        await self._semaphores.get().acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphores.get().release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def upstream_limiter(name):
+    """Shared limiter for an upstream, sized by the <NAME>_MAX_CONCURRENCY setting"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limit = getattr(settings, f"{name.upper()}_MAX_CONCURRENCY")
+                limiter = _limiters[name] = UpstreamLimiter(name, limit)
+    return limiter
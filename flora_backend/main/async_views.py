@@ -0,0 +1,163 @@
+# main/async_views.py
+
+"""
+Async counterparts of IdentifyPlantView.create and PlantDetailsView for ASGI
+deployments. While PlantNet or GROQ is answering, the worker's event loop
+keeps serving other requests instead of blocking a thread.
+"""
+
+import functools
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST
+from rest_framework import status
+
+from . import metrics
+from .jobs import check_callback_url, enqueue_identification
+from .services import (
+    ServiceError,
+    aget_plant_details,
+    aidentify_upload,
+    astream_plant_details,
+)
+from .persistence import record_identification
+from .pipeline import adescribe, adescribe_events
+from .shaping import (
+    add_details_cache_headers,
+    details_etag,
+    not_modified,
+    requested_fields,
+    shape_details,
+    shape_events,
+    shape_identification,
+    shape_options,
+)
+from .streaming import request_flag, sse_response, wants_stream
+
+logger = logging.getLogger(__name__)
+
+
+def _request_data(request):
+    """JSON or form body, like DRF's request.data"""
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            return {}
+    return request.POST
+
+
+def asgi_only(view):
+    """
+    Refuse requests that didn't come through an ASGI server. Under WSGI Django
+    runs each async view on a fresh event loop, and the loop-bound upstream
+    clients would be rebuilt (and leaked) for every request.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"error": "The /api/async/ endpoints need an ASGI server; use the endpoints without /async/ under WSGI"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def _enqueue(request, uploaded_image):
+    callback_url = request.POST.get("callback_url")
+    try:
+        # Both resolve names or touch the database, so keep them off the event loop
+        await sync_to_async(check_callback_url)(callback_url)
+        plant = await sync_to_async(enqueue_identification)(uploaded_image, callback_url)
+    except ServiceError as e:
+        return JsonResponse(e.payload, status=e.status_code)
+    status_url = request.build_absolute_uri(reverse("identify-status", kwargs={"pk": plant.pk}))
+    return JsonResponse(
+        {"id": plant.id, "status": plant.status, "status_url": status_url},
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": status_url},
+    )
+
+
+@csrf_exempt
+@asgi_only
+@require_POST
+async def identify_plant(request):
+    with metrics.timed("upload_parse"):
+        uploaded_image = request.FILES.get("image")
+    if not uploaded_image:
+        return JsonResponse(
+            {"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if request_flag(request, request.POST, "queue"):
+        return await _enqueue(request, uploaded_image)
+
+    try:
+        options = shape_options(request, request.POST)
+        response_data, cache_status = await aidentify_upload(uploaded_image, request.POST.get("organ"))
+    except ServiceError as e:
+        return JsonResponse(e.payload, status=e.status_code, headers=e.headers)
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return JsonResponse(
+            {"error": f"An unexpected error occurred: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    await sync_to_async(record_identification)(uploaded_image, response_data)
+
+    include_details = request_flag(request, request.POST, "include_details")
+    if include_details and wants_stream(request, request.POST):
+        response = sse_response(shape_events(adescribe_events(response_data), options))
+    else:
+        response_data = shape_identification(await adescribe(response_data, include_details), **options)
+        response = JsonResponse(response_data, status=status.HTTP_200_OK)
+    if cache_status:
+        response["X-Cache"] = cache_status
+    return response
+
+
+@csrf_exempt
+@asgi_only
+@require_http_methods(["GET", "POST"])
+async def plant_details(request):
+    data = request.GET if request.method == "GET" else _request_data(request)
+    plant_name = data.get("plant_name")
+    if not plant_name:
+        return JsonResponse(
+            {"error": "Plant name is required"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    logger.info(f"Received request for plant details: {plant_name}")
+
+    if wants_stream(request, data):
+        try:
+            return sse_response(await astream_plant_details(plant_name))
+        except ServiceError as e:
+            return JsonResponse(e.payload, status=e.status_code, headers=e.headers)
+
+    try:
+        parsed_data, cache_status = await aget_plant_details(plant_name)
+    except ServiceError as e:
+        return JsonResponse(e.payload, status=e.status_code, headers=e.headers)
+    except Exception as e:
+        logger.error(f"Error getting plant details: {str(e)}", exc_info=True)
+        return JsonResponse(
+            {"error": f"Failed to get plant details: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    parsed_data = shape_details(parsed_data, requested_fields(request, data))
+    etag = details_etag(parsed_data)
+    response = not_modified(request, etag) or JsonResponse(parsed_data, status=status.HTTP_200_OK)
+    if cache_status:
+        response["X-Cache"] = cache_status
+    return add_details_cache_headers(response, etag)
@@ -0,0 +1,120 @@
+# main/batch.py
+
+"""
+Batch identification: many independent images and/or multi-organ sets of
+one plant in a single request, fanned out over a bounded worker pool.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .cache import image_digest
+from .persistence import record_identification
+from .services import ServiceError, identify_images
+
+logger = logging.getLogger(__name__)
+
+SET_PREFIX = "plant_"
+ORGANS_PREFIX = "organs_"
+
+
+def parse_batch(files, data):
+    """
+    Batch items from a multipart request. Every file under `images` is
+    identified on its own; the files under each `plant_<key>` field are
+    identified together as one plant, with optional organ hints (one per
+    image, in order) in `organs_<key>`. Returns (item_id, images, organs)
+    tuples.
+    """
+    items = []
+    for index, uploaded_image in enumerate(files.getlist("images")):
+        items.append((f"images[{index}]", [uploaded_image], None))
+    for field in files:
+        if field.startswith(SET_PREFIX):
+            key = field[len(SET_PREFIX):]
+            organs = data.getlist(f"{ORGANS_PREFIX}{key}") or None
+            items.append((field, files.getlist(field), organs))
+    return items
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IDENTIFY_BATCH_WORKERS,
+                    thread_name_prefix="identify-batch",
+                )
+    return _executor
+
+
+def _identify_item(images, organs):
+    # Pool threads outlive requests, so nothing else closes their connections
+    close_old_connections()
+    try:
+        return _identify_and_record(images, organs)
+    finally:
+        close_old_connections()
+
+
+def _identify_and_record(images, organs):
+    try:
+        response_data, cache_status = identify_images(images, organs)
+    except ServiceError as e:
+        return {"status": e.status_code, "error": e.payload}
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return {"status": 500, "error": {"error": f"An unexpected error occurred: {str(e)}"}}
+    # An IdentifiedPlant holds one image, so a multi-organ set is stored with
+    # its first. Saved here rather than queued so the item can report its id.
+    plant = record_identification(images[0], response_data, wait=True)
+    result = {"status": 200, "result": response_data}
+    if plant is not None:
+        result["plant_id"] = plant.pk
+    if cache_status:
+        result["cache"] = cache_status
+    return result
+
+
+def identify_batch(items):
+    """
+    Identify batch items concurrently. Items with identical content are sent
+    to PlantNet once; later copies report the id of the first as duplicate_of.
+    Returns one result per item, in order.
+    """
+    executor = _get_executor()
+    pending = {}
+    results = []
+    for item_id, images, organs in items:
+        if organs and len(organs) != len(images):
+            results.append((item_id, None, {
+                "status": 400,
+                "error": {"error": f"Expected one organ per image for {item_id}"},
+            }))
+            continue
+
+        key = (tuple(image_digest(image) for image in images), tuple(organs or ()))
+        if key in pending:
+            first_id, future = pending[key]
+            results.append((item_id, first_id, future))
+        else:
+            pending[key] = (item_id, executor.submit(_identify_item, images, organs))
+            results.append((item_id, None, pending[key][1]))
+
+    response = []
+    for item_id, duplicate_of, outcome in results:
+        item = {"id": item_id}
+        if duplicate_of:
+            item["duplicate_of"] = duplicate_of
+        item.update(outcome.result() if hasattr(outcome, "result") else outcome)
+        response.append(item)
+    return response
@@ -0,0 +1,390 @@
+# main/cache.py
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LocMemBackend:
+    """Per-process LRU store with per-entry expiry"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """Delegates to a configured Django cache (eviction is handled by its OPTIONS)"""
+
+    def __init__(self, alias="default", key_prefix="flora"):
+        from django.core.cache import caches
+
+        self.cache = caches[alias]
+        self.key_prefix = key_prefix
+
+    def _key(self, key):
+        return f"{self.key_prefix}:{key}"
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value, ttl=None):
+        self.cache.set(self._key(key), value, timeout=ttl)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        self.cache.clear()
+
+
+class SQLiteBackend:
+    """On-disk store shared by every worker on the host, evicting least recently used rows"""
+
+    def __init__(self, path, max_entries=10000, table="cache"):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.table = table
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_accessed_at "
+                f"ON {self.table} (accessed_at)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            conn.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return value
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def build_backend(name, max_entries=1024, path=None, alias="default", namespace="flora"):
+    """Create a cache backend from its short settings name"""
+    if name == "locmem":
+        return LocMemBackend(max_entries=max_entries)
+    if name == "django":
+        return DjangoCacheBackend(alias=alias, key_prefix=namespace)
+    if name == "sqlite":
+        return SQLiteBackend(path, max_entries=max_entries, table=f"{namespace}_cache")
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+class ResultCache:
+    """JSON result cache over a pluggable backend that keeps hit/miss counters"""
+
+    def __init__(self, backend, ttl=None, namespace="flora"):
+        self.backend = backend
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _count(self, hit):
+        metrics.count_cache(self.namespace, hit)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        raw = self.backend.get(self._key(key))
+        self._count(raw is not None)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def set(self, key, value):
+        self.backend.set(self._key(key), json.dumps(value), ttl=self.ttl)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        stats = {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "ttl": self.ttl,
+        }
+        try:
+            stats["size"] = len(self.backend)
+        except TypeError:
+            pass  # Django cache backends don't expose their size
+        return stats
+
+
+def image_digest(uploaded_file):
+    """SHA-256 of the uploaded bytes, read chunk by chunk"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+# A dHash with fewer differing neighbours than this (or as many the other way)
+# comes from a flat or low-detail photo: all such photos share it
+PERCEPTUAL_MIN_BITS = 8
+# Largest difference in mean brightness (0-255) between the matching cells of
+# two photos' brightness grids for a dHash match to count
+PERCEPTUAL_MAX_BRIGHTNESS_DIFF = 24
+
+
+class PerceptualKey:
+    """
+    Near-duplicate cache key. Entries stored under it keep the photo's
+    brightness grid, and a lookup only counts as a hit when its own grid is
+    close to it, so photos that merely share a dHash don't share results.
+    """
+
+    def __init__(self, dhash, grid):
+        self.dhash = dhash
+        self.grid = grid
+
+    def __str__(self):
+        return f"dhash:{self.dhash}"
+
+    def matches(self, grid):
+        return len(grid) == len(self.grid) and all(
+            abs(a - b) <= PERCEPTUAL_MAX_BRIGHTNESS_DIFF for a, b in zip(grid, self.grid)
+        )
+
+
+def perceptual_fingerprint(uploaded_file, hash_size=8, grid_size=4):
+    """
+    Difference hash (dHash) so re-encoded or resized copies of a photo share
+    a key, plus a coarse brightness grid to check a match against. None for
+    unreadable images and for flat ones whose dHash many photos share.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(uploaded_file) as image:
+            image.draft("L", (hash_size * 8, hash_size * 8))  # Cheap JPEG downscale on decode
+            gray = image.convert("L")
+            pixels = list(gray.resize((hash_size + 1, hash_size)).getdata())
+            grid = list(gray.resize((grid_size, grid_size)).getdata())
+    except Exception as e:
+        logger.warning(f"Could not compute perceptual hash: {str(e)}")
+        return None
+    finally:
+        uploaded_file.seek(0)
+
+    rows = []
+    for row in range(hash_size):
+        bits = 0
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+        rows.append(bits)
+    set_bits = sum(bin(bits).count("1") for bits in rows)
+    if len(set(rows)) == 1 or not PERCEPTUAL_MIN_BITS <= set_bits <= hash_size * hash_size - PERCEPTUAL_MIN_BITS:
+        return None
+    dhash = 0
+    for bits in rows:
+        dhash = (dhash << hash_size) | bits
+    return PerceptualKey(f"{dhash:0{hash_size * hash_size // 4}x}", grid)
+
+
+class IdentificationCache(ResultCache):
+    """Caches extracted PlantNet responses by image content"""
+
+    def __init__(self, backend, ttl=None, namespace="identify", use_perceptual_hash=False):
+        super().__init__(backend, ttl=ttl, namespace=namespace)
+        self.use_perceptual_hash = use_perceptual_hash
+
+    def keys_for(self, uploaded_file):
+        """Cache keys for an upload, exact content hash first"""
+        keys = [f"sha256:{image_digest(uploaded_file)}"]
+        if self.use_perceptual_hash:
+            perceptual_key = perceptual_fingerprint(uploaded_file)
+            if perceptual_key:
+                keys.append(perceptual_key)
+        return keys
+
+    def keys_for_images(self, uploaded_files, organs=None):
+        """Cache keys for a multi-image (multi-organ) identification of one plant"""
+        if len(uploaded_files) == 1 and not organs:
+            return self.keys_for(uploaded_files[0])
+        digest = hashlib.sha256()
+        for uploaded_file in uploaded_files:
+            digest.update(image_digest(uploaded_file).encode())
+        digest.update(",".join(organs or []).encode())
+        return [f"set:{digest.hexdigest()}"]
+
+    def lookup(self, keys):
+        value = None
+        for key in keys:
+            raw = self.backend.get(self._key(str(key)))
+            if raw is None:
+                continue
+            value = json.loads(raw)
+            if isinstance(key, PerceptualKey):
+                # Entries without a grid predate the check and can't be verified
+                value = value.get("result") if key.matches(value.get("grid") or []) else None
+            if value is not None:
+                break
+        self._count(value is not None)
+        return value
+
+    def store(self, keys, value):
+        raw = json.dumps(value)
+        for key in keys:
+            if isinstance(key, PerceptualKey):
+                self.backend.set(self._key(str(key)), json.dumps({"grid": key.grid, "result": value}), ttl=self.ttl)
+            else:
+                self.backend.set(self._key(key), raw, ttl=self.ttl)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _configured_cache(prefix, namespace, factory):
+    """
+    Process-wide cache configured by the <prefix>_CACHE_* settings, or None
+    when its backend is 'none'
+    """
+    backend_name = getattr(settings, f"{prefix}_CACHE_BACKEND")
+    if backend_name == "none":
+        return None
+    cache = _caches.get(prefix)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(prefix)
+            if cache is None:
+                backend = build_backend(
+                    backend_name,
+                    max_entries=getattr(settings, f"{prefix}_CACHE_MAX_ENTRIES"),
+                    path=getattr(settings, f"{prefix}_CACHE_SQLITE_PATH"),
+                    alias=getattr(settings, f"{prefix}_CACHE_ALIAS"),
+                    namespace=namespace,
+                )
+                cache = _caches[prefix] = factory(backend, getattr(settings, f"{prefix}_CACHE_TTL"))
+    return cache
+
+
+def get_identification_cache():
+    """Identification results keyed by image content"""
+    return _configured_cache(
+        "IDENTIFY",
+        "identify",
+        lambda backend, ttl: IdentificationCache(
+            backend,
+            ttl=ttl,
+            use_perceptual_hash=settings.IDENTIFY_CACHE_PERCEPTUAL_HASH,
+        ),
+    )
+
+
+def get_details_cache():
+    """GROQ plant details keyed by normalized plant name, model and prompt version"""
+    return _configured_cache(
+        "DETAILS",
+        "details",
+        lambda backend, ttl: ResultCache(backend, ttl=ttl, namespace="details"),
+    )
@@ -0,0 +1,219 @@
+# main/classifier.py
+
+"""
+Identification backends. PlantNet (see services.PlantNetBackend) is one;
+LocalClassifier runs an ONNX image classifier on this machine, in a pool of
+worker processes so inference doesn't hold the GIL of the web workers.
+Both return results in the same shape: {"best_match": ..., "results":
+[{"scientific_name", "common_names", "score"}, ...]}, best first.
+"""
+
+import abc
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BackendUnavailable(Exception):
+    """A backend can't run here (not configured, missing dependency, broken model)"""
+
+
+class IdentificationBackend(abc.ABC):
+    """Interface for identification backends"""
+
+    name = None
+
+    @abc.abstractmethod
+    def identify(self, uploaded_images, organs=None):
+        """Results for one plant shown in one or more images"""
+
+    async def aidentify(self, uploaded_images, organs=None):
+        """Async version of identify; runs identify in a thread unless overridden"""
+        return await asyncio.to_thread(self.identify, uploaded_images, organs)
+
+    def is_confident(self, results):
+        """Whether these results are good enough to answer without asking the next backend"""
+        return True
+
+
+# State of each classifier worker process, set up once by _init_worker
+_session = None
+_input_name = None
+_labels = None
+_input_size = None
+_top_k = None
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def load_labels(path):
+    """
+    Class labels from a JSON list, in model output order. Items are either a
+    scientific name or {"scientific_name": ..., "common_names": [...]}.
+    """
+    with open(path, encoding="utf-8") as f:
+        labels = json.load(f)
+    return [
+        {"scientific_name": label, "common_names": []} if isinstance(label, str) else label
+        for label in labels
+    ]
+
+
+def _init_worker(model_path, labels_path, input_size, top_k):
+    global _session, _input_name, _labels, _input_size, _top_k
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    # One process per core already; keep each session single-threaded
+    options.intra_op_num_threads = 1
+    options.inter_op_num_threads = 1
+    _session = onnxruntime.InferenceSession(
+        model_path, sess_options=options, providers=["CPUExecutionProvider"]
+    )
+    _input_name = _session.get_inputs()[0].name
+    _labels = load_labels(labels_path)
+    _input_size = input_size
+    _top_k = top_k
+
+
+def _image_tensor(image_bytes):
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("RGB", (_input_size, _input_size))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image = ImageOps.fit(image, (_input_size, _input_size))
+        pixels = np.asarray(image, dtype=np.float32) / 255.0
+    pixels = (pixels - np.array(IMAGENET_MEAN, dtype=np.float32)) / np.array(IMAGENET_STD, dtype=np.float32)
+    return pixels.transpose(2, 0, 1)
+
+
+def _probabilities(outputs):
+    import numpy as np
+
+    outputs = outputs.astype(np.float64)
+    if outputs.min() >= 0 and abs(outputs.sum() - 1) < 1e-3:
+        return outputs  # the model already ends in a softmax
+    exp = np.exp(outputs - outputs.max())
+    return exp / exp.sum()
+
+
+def _classify(images_bytes):
+    """Runs in a worker process: averaged class probabilities over the images of one plant"""
+    import numpy as np
+
+    batch = np.stack([_image_tensor(image_bytes) for image_bytes in images_bytes])
+    outputs = _session.run(None, {_input_name: batch})[0]
+    probabilities = np.mean([_probabilities(row) for row in outputs], axis=0)
+    top = np.argsort(probabilities)[::-1][:_top_k]
+    results = []
+    for index in top:
+        label = _labels[index] if index < len(_labels) else {"scientific_name": f"class_{index}"}
+        results.append({
+            "scientific_name": label.get("scientific_name"),
+            "common_names": label.get("common_names") or [],
+            "score": round(float(probabilities[index]), 5),
+        })
+    return results
+
+
+class LocalClassifier(IdentificationBackend):
+    """
+    ONNX classifier on the CPU of this machine. Needs the optional onnxruntime
+    and numpy packages, a model taking a normalized NCHW RGB batch and a
+    labels file. Answers on its own when its top score reaches min_confidence.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path, labels_path, input_size=224, top_k=5, min_confidence=0.85, workers=2):
+        if not model_path or not labels_path:
+            raise BackendUnavailable("LOCAL_CLASSIFIER_MODEL and LOCAL_CLASSIFIER_LABELS must be set")
+        try:
+            import numpy  # noqa: F401
+            import onnxruntime  # noqa: F401
+        except ImportError as e:
+            raise BackendUnavailable(f"Local classifier needs onnxruntime and numpy: {str(e)}")
+        self.min_confidence = min_confidence
+        self.workers = workers
+        self._initargs = (str(model_path), str(labels_path), input_size, top_k)
+        self._executor = self._new_executor()
+        self._executor_lock = threading.Lock()
+
+    def _new_executor(self):
+        # Spawned, not forked: the web process has threads and open connections
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=self._initargs,
+        )
+
+    def _submit(self, images_bytes):
+        executor = self._executor
+        try:
+            return executor.submit(_classify, images_bytes)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool, unless
+            # another thread has already replaced the one that failed
+            with self._executor_lock:
+                if self._executor is executor:
+                    logger.warning("Local classifier pool broken, restarting it")
+                    self._executor = self._new_executor()
+                    executor.shutdown(wait=False)
+            return self._executor.submit(_classify, images_bytes)
+
+    def _read(self, uploaded_images):
+        images_bytes = []
+        for uploaded_image in uploaded_images:
+            uploaded_image.seek(0)
+            images_bytes.append(uploaded_image.read())
+            uploaded_image.seek(0)
+        return images_bytes
+
+    def _results(self, results):
+        return {"best_match": results[0]["scientific_name"] if results else None, "results": results}
+
+    def identify(self, uploaded_images, organs=None):
+        return self._results(self._submit(self._read(uploaded_images)).result())
+
+    async def aidentify(self, uploaded_images, organs=None):
+        images_bytes = await asyncio.to_thread(self._read, uploaded_images)
+        future = self._submit(images_bytes)
+        return self._results(await asyncio.wrap_future(future))
+
+    def is_confident(self, results):
+        top = results["results"][0] if results.get("results") else {}
+        return (top.get("score") or 0) >= self.min_confidence
+
+
+_local_classifier = None
+_local_classifier_lock = threading.Lock()
+
+
+def get_local_classifier():
+    """Process-wide LocalClassifier built from the LOCAL_CLASSIFIER_* settings"""
+    global _local_classifier
+    if _local_classifier is None:
+        with _local_classifier_lock:
+            if _local_classifier is None:
+                _local_classifier = LocalClassifier(
+                    settings.LOCAL_CLASSIFIER_MODEL,
+                    settings.LOCAL_CLASSIFIER_LABELS,
+                    input_size=settings.LOCAL_CLASSIFIER_INPUT_SIZE,
+                    top_k=settings.LOCAL_CLASSIFIER_TOP_K,
+                    min_confidence=settings.LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+                    workers=settings.LOCAL_CLASSIFIER_WORKERS,
+                )
+    return _local_classifier
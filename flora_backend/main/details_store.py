@@ -0,0 +1,46 @@
+# main/details_store.py
+
+"""
+Precomputed plant details. Rows are written in bulk by the
+warm_plant_details command and read before the details cache, so the
+species that cover most traffic are a single indexed lookup.
+"""
+
+import logging
+
+from django.db import DatabaseError
+
+from . import metrics
+from .models import PlantDetails
+
+logger = logging.getLogger(__name__)
+
+
+def get_stored_details(key):
+    """Stored details for a details cache key, or None. Never raises."""
+    try:
+        with metrics.timed("details_store"):
+            details = PlantDetails.objects.filter(key=key).values_list("details", flat=True).first()
+    except DatabaseError as e:
+        logger.warning(f"Plant details store unavailable: {str(e)}")
+        return None
+    metrics.count_cache("details_store", details is not None)
+    return details
+
+
+def save_details(key, plant_name, details):
+    PlantDetails.objects.update_or_create(
+        key=key, defaults={"plant_name": plant_name, "details": details}
+    )
+
+
+def stored_keys(keys):
+    """Which of these keys already have stored details"""
+    stored = set()
+    keys = list(keys)
+    # Chunked to stay under SQLite's bound-parameter limit
+    for start in range(0, len(keys), 500):
+        stored.update(
+            PlantDetails.objects.filter(key__in=keys[start:start + 500]).values_list("key", flat=True)
+        )
+    return stored
@@ -0,0 +1,311 @@
+# main/jobs.py
+
+"""
+Queued identifications. The upload is stored as a pending IdentifiedPlant row
+and the request returns at once; workers claim pending rows from the database,
+identify them and record the outcome on the same row, optionally POSTing it
+to a callback URL. No broker is needed: the table is the queue.
+"""
+
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .media import attach_thumbnail
+from .models import IdentifiedPlant
+from .ratelimit import TokenBucket
+from .services import ServiceError, identification_body, identify_images, plantnet_governor
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_identification(uploaded_image, callback_url=None):
+    """Store the upload as a pending job and wake the in-process worker if enabled"""
+    uploaded_image.seek(0)
+    plant = IdentifiedPlant.objects.create(
+        image=ContentFile(
+            uploaded_image.read(), name=os.path.basename(uploaded_image.name or "plant.jpg")
+        ),
+        status=IdentifiedPlant.STATUS_PENDING,
+        callback_url=callback_url or None,
+    )
+    logger.info(f"Queued identification job {plant.id}")
+    if settings.IDENTIFY_JOBS_IN_PROCESS:
+        get_local_worker().wake()
+    return plant
+
+
+def job_payload(plant):
+    """Status document for a job, as returned by the status endpoint and callbacks"""
+    payload = {"id": plant.id, "status": plant.status}
+    if plant.status == IdentifiedPlant.STATUS_DONE and plant.results:
+        payload["result"] = identification_body(plant.results)
+    elif plant.status == IdentifiedPlant.STATUS_FAILED:
+        payload["error"] = plant.error
+    return payload
+
+
+def requeue_stale_jobs():
+    """Put jobs whose worker died mid-run back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.IDENTIFY_JOB_TIMEOUT)
+    count = IdentifiedPlant.objects.filter(
+        status=IdentifiedPlant.STATUS_RUNNING, started_at__lt=cutoff
+    ).update(status=IdentifiedPlant.STATUS_PENDING)
+    if count:
+        logger.warning(f"Requeued {count} stale identification jobs")
+    return count
+
+
+def claim_jobs(limit):
+    """
+    Mark up to `limit` pending jobs as running for this worker. Each row is
+    claimed with a conditional UPDATE, so concurrent workers (on SQLite too)
+    never run the same job twice. Where the database supports it (Postgres),
+    rows locked by another worker's claim are skipped rather than raced for.
+    """
+    pending = (
+        IdentifiedPlant.objects.filter(status=IdentifiedPlant.STATUS_PENDING)
+        .filter(Q(not_before__isnull=True) | Q(not_before__lte=timezone.now()))
+        .order_by("created_at")
+        .values_list("id", flat=True)
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            claimed = list(pending.select_for_update(skip_locked=True)[:limit])
+            IdentifiedPlant.objects.filter(id__in=claimed).update(
+                status=IdentifiedPlant.STATUS_RUNNING, started_at=timezone.now()
+            )
+        return claimed
+
+    claimed = []
+    for job_id in list(pending[:limit]):
+        updated = IdentifiedPlant.objects.filter(
+            id=job_id, status=IdentifiedPlant.STATUS_PENDING
+        ).update(status=IdentifiedPlant.STATUS_RUNNING, started_at=timezone.now())
+        if updated:
+            claimed.append(job_id)
+    return claimed
+
+
+def callback_url_allowed(url):
+    """
+    Whether job results may be POSTed to url. Hosts in
+    IDENTIFY_JOB_CALLBACK_HOSTS are trusted; without that list any host is
+    accepted as long as every address it resolves to is public, so callbacks
+    can't be aimed at the server's own network.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    allowed_hosts = settings.IDENTIFY_JOB_CALLBACK_HOSTS
+    if allowed_hosts:
+        return parts.hostname.lower() in allowed_hosts
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or 80, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, ValueError):
+        return False
+    return all(ipaddress.ip_address(address[4][0].split("%")[0]).is_global for address in addresses)
+
+
+def check_callback_url(callback_url):
+    """Raise a 400 ServiceError unless callback_url is empty or a valid, allowed URL"""
+    if not callback_url:
+        return
+    url_field = IdentifiedPlant._meta.get_field("callback_url")
+    try:
+        url_field.clean(callback_url, None)
+    except DjangoValidationError:
+        raise ServiceError({"error": "Invalid callback_url"}, 400)
+    if not callback_url_allowed(callback_url):
+        raise ServiceError({"error": "Invalid callback_url"}, 400)
+
+
+def _send_callback(plant):
+    # Checked again at send time: the host may resolve elsewhere than when the job was queued
+    if not callback_url_allowed(plant.callback_url):
+        logger.warning(f"Callback for job {plant.id} skipped: {plant.callback_url} is not an allowed host")
+        return
+    try:
+        response = requests.post(
+            plant.callback_url, json=job_payload(plant), timeout=settings.IDENTIFY_JOB_CALLBACK_TIMEOUT,
+            allow_redirects=False,
+        )
+        logger.info(f"Callback for job {plant.id} answered {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Callback for job {plant.id} failed: {str(e)}")
+
+
+def run_job(job_id):
+    """Identify one claimed job and record the outcome"""
+    plant = IdentifiedPlant.objects.get(id=job_id)
+    plant.attempts += 1
+    try:
+        with plant.image.open("rb") as image_file:
+            uploaded_image = File(image_file, name=os.path.basename(plant.image.name))
+            response_data, _ = identify_images([uploaded_image])
+            attach_thumbnail(plant, image_file)
+    except ServiceError as e:
+        if "retry_after" in e.payload:
+            # Throttled or short-circuited before reaching PlantNet: not a real attempt,
+            # but not worth claiming again before the governor would let it through
+            logger.info(f"Job {plant.id} deferred: {e.payload['error']}")
+            plant.attempts -= 1
+            plant.status = IdentifiedPlant.STATUS_PENDING
+            plant.not_before = timezone.now() + timedelta(seconds=e.payload["retry_after"])
+            plant.save(update_fields=["status", "not_before"])
+            return plant
+        # Upstream and network failures are worth another try, bad images are not
+        if e.status_code >= 500 and plant.attempts < settings.IDENTIFY_JOB_MAX_ATTEMPTS:
+            backoff = settings.IDENTIFY_JOB_RETRY_BACKOFF * 2 ** (plant.attempts - 1)
+            logger.warning(f"Job {plant.id} failed (attempt {plant.attempts}), retrying in {backoff:.0f}s")
+            plant.status = IdentifiedPlant.STATUS_PENDING
+            plant.not_before = timezone.now() + timedelta(seconds=backoff)
+            plant.save(update_fields=["status", "attempts", "not_before"])
+            return plant
+        plant.status = IdentifiedPlant.STATUS_FAILED
+        plant.error = e.payload
+    except Exception as e:
+        logger.error(f"Job {plant.id} failed: {str(e)}", exc_info=True)
+        plant.status = IdentifiedPlant.STATUS_FAILED
+        plant.error = {"error": f"An unexpected error occurred: {str(e)}"}
+    else:
+        plant.status = IdentifiedPlant.STATUS_DONE
+        plant.best_match_scientific_name = response_data.get("best_match_scientific_name")
+        plant.best_match_common_names = response_data.get("best_match_common_names")
+        plant.results = response_data.get("results")
+
+    plant.save(update_fields=[
+        "status", "attempts", "error", "thumbnail",
+        "best_match_scientific_name", "best_match_common_names", "results",
+    ])
+    logger.info(f"Job {plant.id} finished: {plant.status}")
+    if plant.callback_url:
+        _send_callback(plant)
+    return plant
+
+
+class JobWorker:
+    """
+    Polls the job table and runs up to `concurrency` jobs at a time, starting
+    at most `rate` jobs per second (0 for no limit) to respect PlantNet quotas.
+    """
+
+    def __init__(self, concurrency=4, rate=0, poll_interval=1.0, requeue_interval=60):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.requeue_interval = requeue_interval
+        self.bucket = TokenBucket(rate)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="identify-job")
+        self._running = 0
+        self._running_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _run_one(self, job_id):
+        try:
+            run_job(job_id)
+        except Exception as e:
+            logger.error(f"Worker error on job {job_id}: {str(e)}", exc_info=True)
+        finally:
+            close_old_connections()
+            with self._running_lock:
+                self._running -= 1
+            self._wakeup.set()
+
+    def run_once(self):
+        """Claim and start as many jobs as there are free slots; returns how many started"""
+        if plantnet_governor().breaker.retry_after():
+            # PlantNet's circuit is open; leave the jobs queued until it may close
+            return 0
+        with self._running_lock:
+            free = self.concurrency - self._running
+        if free <= 0:
+            return 0
+        job_ids = claim_jobs(free)
+        for job_id in job_ids:
+            self.bucket.acquire()
+            with self._running_lock:
+                self._running += 1
+            self._executor.submit(self._run_one, job_id)
+        return len(job_ids)
+
+    def drain(self):
+        """Run until the queue is empty and every started job has finished"""
+        while True:
+            started = self.run_once()
+            with self._running_lock:
+                running = self._running
+            if not started and not running:
+                return
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def run_forever(self):
+        """Poll until stopped, requeueing jobs lost by dead workers every requeue_interval seconds"""
+        next_requeue = 0
+        while not self._stopped.is_set():
+            try:
+                if time.monotonic() >= next_requeue:
+                    requeue_stale_jobs()
+                    next_requeue = time.monotonic() + self.requeue_interval
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Worker poll failed: {str(e)}", exc_info=True)
+            finally:
+                close_old_connections()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+        self._executor.shutdown(wait=True)
+
+
+_local_worker = None
+_local_worker_lock = threading.Lock()
+
+
+def get_local_worker():
+    """Worker running on a daemon thread inside this web process (IDENTIFY_JOBS_IN_PROCESS)"""
+    global _local_worker
+    if _local_worker is None:
+        with _local_worker_lock:
+            if _local_worker is None:
+                _local_worker = JobWorker(
+                    concurrency=settings.IDENTIFY_JOB_CONCURRENCY,
+                    rate=settings.PLANTNET_RATE_LIMIT,
+                    poll_interval=settings.IDENTIFY_JOB_POLL_INTERVAL,
+                )
+                threading.Thread(
+                    target=_local_worker.run_forever, name="identify-job-worker", daemon=True
+                ).start()
+    return _local_worker
+
+
+def start_local_worker():
+    """
+    Start this process's in-process worker when IDENTIFY_JOBS_IN_PROCESS is on.
+    Called from wsgi.py and asgi.py, so jobs left queued or running by a
+    previous process are picked up without waiting for a new upload.
+    """
+    if settings.IDENTIFY_JOBS_IN_PROCESS:
+        get_local_worker()
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.species import build_index
+
+
+class Command(BaseCommand):
+    help = "Compile the species name index from a tab-separated species file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source", default=str(settings.SPECIES_INDEX_SOURCE),
+            help="TSV file: scientific name, common names and synonyms (; separated)",
+        )
+        parser.add_argument(
+            "--output", default=str(settings.SPECIES_INDEX_PATH),
+            help="SQLite file to write",
+        )
+
+    def handle(self, *args, **options):
+        count = build_index(options["source"], options["output"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} species into {options['output']}"))
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.jobs import JobWorker, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued identification jobs (queue=true uploads) from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.IDENTIFY_JOB_CONCURRENCY,
+            help="Jobs to run at the same time",
+        )
+        parser.add_argument(
+            "--rate", type=float, default=settings.PLANTNET_RATE_LIMIT,
+            help="Max PlantNet calls started per second (0 = no limit)",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=settings.IDENTIFY_JOB_POLL_INTERVAL,
+            help="Seconds between polls of the job table",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Run until the queue is empty, then exit",
+        )
+
+    def handle(self, *args, **options):
+        worker = JobWorker(
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+            poll_interval=options["poll_interval"],
+        )
+        if options["once"]:
+            requeue_stale_jobs()
+            worker.drain()
+            self.stdout.write(self.style.SUCCESS("Job queue drained"))
+            return
+
+        self.stdout.write(
+            f"Identification worker running (concurrency {options['concurrency']}, "
+            f"rate {options['rate'] or 'unlimited'}/s)"
+        )
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            worker.stop()
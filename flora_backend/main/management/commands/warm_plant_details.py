@@ -0,0 +1,96 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main.details_store import save_details, stored_keys
+from main.services import ServiceError, canonical_plant_name, details_cache_key, fetch_plant_details
+from main.species import read_source
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate plant details with GROQ for a list of species and store them, "
+        "skipping species already stored so an interrupted run can be resumed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file", default=str(settings.SPECIES_INDEX_SOURCE),
+            help="Species list: one name per line, or the species index TSV (first column)",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=4,
+            help="GROQ calls in flight at once",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=0,
+            help="Generate at most this many species (0 = all)",
+        )
+        parser.add_argument(
+            "--refresh", action="store_true",
+            help="Regenerate species that are already stored",
+        )
+        parser.add_argument(
+            "--retries", type=int, default=3,
+            help="Retries per species when GROQ is rate limited or unavailable",
+        )
+
+    def _generate(self, plant_name, retries):
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    return fetch_plant_details(plant_name)
+                except ServiceError as e:
+                    # Throttled by the governor or the circuit is open: wait and retry
+                    if "retry_after" not in e.payload or attempt == retries:
+                        raise
+                    time.sleep(e.payload["retry_after"])
+        finally:
+            close_old_connections()
+
+    def handle(self, *args, **options):
+        plants = {}
+        for scientific_name, _, _ in read_source(options["file"]):
+            plant_name = canonical_plant_name(scientific_name)
+            plants.setdefault(details_cache_key(plant_name), plant_name)
+
+        todo = list(plants.items())
+        if not options["refresh"]:
+            stored = stored_keys(plants)
+            todo = [(key, name) for key, name in todo if key not in stored]
+        if options["limit"]:
+            todo = todo[:options["limit"]]
+        self.stdout.write(f"{len(plants)} species, {len(todo)} to generate")
+
+        done = failed = 0
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=options["concurrency"], thread_name_prefix="warm-details")
+        futures = {
+            executor.submit(self._generate, plant_name, options["retries"]): (key, plant_name)
+            for key, plant_name in todo
+        }
+        try:
+            for future in as_completed(futures):
+                key, plant_name = futures[future]
+                try:
+                    details = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{plant_name}: {str(e)}")
+                    continue
+                # Saved one by one, so progress survives an interrupted run
+                save_details(key, plant_name, details)
+                done += 1
+                if done % 10 == 0:
+                    rate = done / (time.monotonic() - started)
+                    self.stdout.write(f"{done}/{len(todo)} stored ({rate:.1f}/s)")
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.stdout.write(f"Interrupted after {done} species; run again to resume")
+            return
+        executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"Stored {done} species, {failed} failed"))
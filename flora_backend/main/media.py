@@ -0,0 +1,75 @@
+# main/media.py
+
+"""
+Storage and thumbnails for IdentifiedPlant images. The storage backend is
+chosen by MEDIA_STORAGE in settings (see STORAGES there).
+"""
+
+import hashlib
+import logging
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+from .preprocessing import EXTENSIONS, preprocess_image
+
+logger = logging.getLogger(__name__)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Local storage that names every file after the SHA-256 of its content,
+    under its upload_to directory (plant_images/ab/abcd....jpg). The same
+    photo uploaded again is stored once, and since a name never gets
+    different content, files can be served with far-future cache headers.
+    Rows may share a file, so don't delete a row's image with the row.
+    """
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(directory, hexdigest[:2], f"{hexdigest}{extension}")
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+def make_thumbnail(fileobj, name):
+    """ContentFile with a THUMBNAIL_SIZE thumbnail of an image, or None if it can't be made"""
+    image_format = settings.THUMBNAIL_FORMAT
+    fileobj.seek(0)
+    try:
+        data, _ = preprocess_image(
+            fileobj,
+            max_edge=settings.THUMBNAIL_SIZE,
+            image_format=image_format,
+            quality=settings.THUMBNAIL_QUALITY,
+        )
+    except Exception as e:
+        logger.warning(f"Could not make a thumbnail of {name}: {str(e)}")
+        return None
+    finally:
+        fileobj.seek(0)
+    base_name = os.path.splitext(os.path.basename(name or "plant"))[0]
+    return ContentFile(data, name=f"{base_name}.{EXTENSIONS[image_format]}")
+
+
+def attach_thumbnail(plant, fileobj=None):
+    """
+    Set plant.thumbnail from its image (or from fileobj, an already open copy
+    of it) unless thumbnails are off. The caller saves the row.
+    """
+    if not settings.THUMBNAIL_SIZE or plant.thumbnail or not plant.image:
+        return
+    if fileobj is None:
+        # Unsaved rows hold the upload itself; don't open (and later close) it
+        fileobj = plant.image.file
+    plant.thumbnail = make_thumbnail(fileobj, plant.image.name)
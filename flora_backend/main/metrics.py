@@ -0,0 +1,177 @@
+# main/metrics.py
+
+"""
+In-process latency and traffic metrics, rendered in the Prometheus text
+format at /metrics. Recording is a lock and a bisect per observation, cheap
+enough to leave on. Values are per process: scrape each worker, or run one
+worker per metrics target.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Seconds; covers cache hits (sub-ms) up to slow LLM completions
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels_text(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((labels, list(series)) for labels, series in self._values.items())
+        for labels, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                labels_text = _labels_text(self.labelnames, labels, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels_text} {cumulative}")
+            labels_text = _labels_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{labels_text} {series[-1]}")
+            lines.append(f"{self.name}_count{labels_text} {cumulative}")
+        return lines
+
+
+HTTP_DURATION = Histogram(
+    "flora_http_request_duration_seconds",
+    "Time to produce a response (first byte for streams)",
+    ("method", "view", "status"),
+)
+STAGE_DURATION = Histogram(
+    "flora_stage_duration_seconds",
+    "Time spent in each stage of request handling",
+    ("stage",),
+)
+PAYLOAD_BYTES = Histogram(
+    "flora_payload_bytes",
+    "Sizes of uploads, upstream answers and responses",
+    ("kind",),
+    buckets=BYTES_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "flora_upstream_responses_total",
+    "Upstream API calls by status code (error: no answer)",
+    ("upstream", "status"),
+)
+UPSTREAM_GOVERNOR = Counter(
+    "flora_upstream_governor_total",
+    "Upstream calls let through, throttled or short-circuited by the governor",
+    ("upstream", "outcome"),
+)
+CACHE_REQUESTS = Counter(
+    "flora_cache_requests_total",
+    "Cache and store lookups by result",
+    ("cache", "result"),
+)
+
+METRICS = (HTTP_DURATION, STAGE_DURATION, PAYLOAD_BYTES, UPSTREAM_RESPONSES, UPSTREAM_GOVERNOR, CACHE_REQUESTS)
+
+
+def enabled():
+    return settings.METRICS_ENABLED
+
+
+@contextmanager
+def timed(stage):
+    """Record how long the enclosed block takes as a stage"""
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, stage)
+
+
+@contextmanager
+def upstream_call(upstream, stage):
+    """timed(stage), also counting the upstream status code (from the exception on failure)"""
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    status = "200"
+    try:
+        yield
+    except Exception as e:
+        status = str(getattr(e, "status_code", None) or "error")
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, stage)
+        UPSTREAM_RESPONSES.inc(upstream, status)
+
+
+def observe_payload(kind, size):
+    if enabled() and size is not None:
+        PAYLOAD_BYTES.observe(size, kind)
+
+
+def count_cache(cache, hit):
+    if enabled():
+        CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+def count_governor(upstream, outcome):
+    if enabled():
+        UPSTREAM_GOVERNOR.inc(upstream, outcome)
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,103 @@
+# main/middleware.py
+
+import gzip
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # Optional: pip install brotli
+    brotli = None
+
+re_accepts_br = re.compile(r"\bbr\b")
+re_accepts_gzip = re.compile(r"\bgzip\b")
+BROTLI_QUALITY = 5  # Close to gzip's speed for dynamic responses, noticeably smaller
+
+
+class MetricsMiddleware:
+    """Records the duration, status and sizes of every request; works for sync and async views"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, start)
+        return response
+
+    def _record(self, request, response, start):
+        if not metrics.enabled():
+            return
+        # View names rather than paths keep the label set small
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        metrics.HTTP_DURATION.observe(
+            time.perf_counter() - start, request.method, view, str(response.status_code)
+        )
+        content_length = request.META.get("CONTENT_LENGTH")
+        if content_length and content_length.isdigit():
+            metrics.observe_payload("request", int(content_length))
+        if not response.streaming:
+            metrics.observe_payload("response", len(response.content))
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Brotli (when installed and accepted) or gzip for JSON responses of
+    RESPONSE_COMPRESSION_MIN_SIZE bytes or more. Only JSON: HTML pages such
+    as the browsable API and the admin carry CSRF tokens, and compressing
+    them would give up Django's BREACH protection. Streamed responses are
+    left alone: gzip would hold server-sent events back until enough of
+    them had arrived to fill a block.
+    """
+
+    def process_response(self, request, response):
+        if not settings.RESPONSE_COMPRESSION or response.streaming:
+            return response
+        content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            return response
+        if response.has_header("Content-Encoding") or len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if brotli is not None and re_accepts_br.search(accept_encoding):
+            encoding, content = "br", brotli.compress(response.content, quality=BROTLI_QUALITY)
+        elif re_accepts_gzip.search(accept_encoding):
+            encoding, content = "gzip", gzip.compress(response.content, compresslevel=6, mtime=0)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = encoding
+        # The encoded bytes differ, so a strong ETag must become weak (RFC 9110 8.8.1)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
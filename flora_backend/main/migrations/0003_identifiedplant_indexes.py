@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_rename_result_identifiedplant_results_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='identifiedplant',
+            index=models.Index(fields=['-created_at'], name='identified_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='identifiedplant',
+            index=models.Index(fields=['best_match_scientific_name'], name='identified_name_idx'),
+        ),
+    ]
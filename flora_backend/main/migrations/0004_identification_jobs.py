@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_identifiedplant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='identifiedplant',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='identifiedplant',
+            name='callback_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='identifiedplant',
+            name='error',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='identifiedplant',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='identifiedplant',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='done', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='identifiedplant',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='identified_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='identifiedplant',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['started_at'], name='identified_running_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_plant_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='identifiedplant',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='plant_thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_identifiedplant_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='identifiedplant',
+            name='not_before',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,11 +1,58 @@
 from django.db import models
 
 class IdentifiedPlant(models.Model):
+    # Identifications made in the request are stored as done; queued ones
+    # (see main.jobs) move from pending through running to done or failed
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     image = models.ImageField(upload_to='plant_images/')
+    thumbnail = models.ImageField(upload_to='plant_thumbnails/', blank=True, null=True)
     best_match_scientific_name = models.CharField(max_length=255, blank=True, null=True)
     best_match_common_names = models.TextField(blank=True, null=True)
     results = models.JSONField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_DONE)
+    error = models.JSONField(blank=True, null=True)
+    callback_url = models.URLField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Deferred or retried jobs are not claimed again before this time
+    not_before = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at'], name='identified_created_at_idx'),
+            models.Index(fields=['best_match_scientific_name'], name='identified_name_idx'),
+            # Small partial indexes the job workers poll
+            models.Index(fields=['created_at'], name='identified_pending_idx', condition=models.Q(status='pending')),
+            models.Index(fields=['started_at'], name='identified_running_idx', condition=models.Q(status='running')),
+        ]
+
+    def __str__(self):
+        return f"Plant {self.id}: {self.best_match_scientific_name or 'Unknown'}"
+
+class PlantDetails(models.Model):
+    # Precomputed GROQ details (see `manage.py warm_plant_details`), read
+    # before the details cache. key is services.details_cache_key: model,
+    # prompt version and normalized canonical name, so a new prompt never
+    # serves old answers.
+    key = models.CharField(max_length=255, unique=True)
+    plant_name = models.CharField(max_length=255)
+    details = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'plant details'
+
     def __str__(self):
-        return f"Plant {self.id}: {self.best_match_scientific_name or 'Unknown'}"
\ No newline at end of file
+        return self.plant_name
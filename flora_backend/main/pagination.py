@@ -0,0 +1,14 @@
+# main/pagination.py
+
+from rest_framework.pagination import CursorPagination
+
+
+class IdentificationCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the created_at index: every page is an index range
+    scan, however deep into the history it is, and no COUNT(*) is run
+    """
+    ordering = '-created_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
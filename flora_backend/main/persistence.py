@@ -0,0 +1,150 @@
+# main/persistence.py
+
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+
+from . import metrics
+from .media import attach_thumbnail
+from .models import IdentifiedPlant
+
+logger = logging.getLogger(__name__)
+
+
+def build_identified_plant(uploaded_image, response_data):
+    """Unsaved IdentifiedPlant for an identification, holding its own copy of the image"""
+    uploaded_image.seek(0)
+    image = ContentFile(
+        uploaded_image.read(), name=os.path.basename(uploaded_image.name or "plant.jpg")
+    )
+    uploaded_image.seek(0)
+    return IdentifiedPlant(
+        image=image,
+        best_match_scientific_name=response_data.get("best_match_scientific_name"),
+        best_match_common_names=response_data.get("best_match_common_names"),
+        results=response_data.get("results"),
+    )
+
+
+class WriteBehindQueue:
+    """
+    Saves IdentifiedPlant rows on a background thread, in bulk, so responses
+    don't wait for the image write and the INSERT. Queued rows hold their
+    image in memory, so the queue is bounded by rows and by image bytes;
+    when either is reached the caller saves the row itself rather than
+    dropping it.
+    """
+
+    def __init__(self, maxsize=200, max_bytes=64 * 1024 * 1024, batch_size=50):
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._queued_bytes = 0
+        self._bytes_lock = threading.Lock()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="identification-writer", daemon=True
+                    )
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _reserve(self, size):
+        with self._bytes_lock:
+            if self._queued_bytes + size > self.max_bytes:
+                return False
+            self._queued_bytes += size
+            return True
+
+    def _release(self, size):
+        with self._bytes_lock:
+            self._queued_bytes -= size
+
+    def put(self, plant):
+        self._ensure_started()
+        size = plant.image.size if plant.image else 0
+        if self._reserve(size):
+            try:
+                self._queue.put_nowait((plant, size))
+                return
+            except queue.Full:
+                self._release(size)
+        logger.warning("Identification write-behind queue full, saving inline")
+        attach_thumbnail(plant)
+        plant.save()
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            plants = [plant for plant, _ in batch]
+            try:
+                for plant in plants:
+                    attach_thumbnail(plant)
+                IdentifiedPlant.objects.bulk_create(plants)
+            except Exception as e:
+                logger.error(f"Failed to save {len(plants)} identifications: {str(e)}", exc_info=True)
+            finally:
+                close_old_connections()
+                self._release(sum(size for _, size in batch))
+                for _ in batch:
+                    self._queue.task_done()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindQueue(
+                    maxsize=settings.IDENTIFY_PERSIST_QUEUE_SIZE,
+                    max_bytes=settings.IDENTIFY_PERSIST_QUEUE_BYTES,
+                )
+    return _writer
+
+
+def record_identification(uploaded_image, response_data, wait=False):
+    """
+    Store an identification as an IdentifiedPlant row, through the
+    write-behind queue unless IDENTIFY_PERSIST_ASYNC is off or `wait` is set
+    (the caller needs the id). Returns the row, which has no id yet if it was
+    queued, or None if nothing was stored. Never raises: a failed write must
+    not fail the identification.
+    """
+    if not settings.IDENTIFY_PERSIST:
+        return None
+    try:
+        with metrics.timed("persist"):
+            plant = build_identified_plant(uploaded_image, response_data)
+            if settings.IDENTIFY_PERSIST_ASYNC and not wait:
+                get_writer().put(plant)
+            else:
+                attach_thumbnail(plant)
+                plant.save()
+            return plant
+    except Exception as e:
+        logger.error(f"Failed to save identification: {str(e)}", exc_info=True)
+        return None
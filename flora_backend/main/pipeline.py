@@ -0,0 +1,182 @@
+# main/pipeline.py
+
+"""
+Identify-and-describe flow. Once PlantNet has answered, details for the top
+match are looked up straight away instead of waiting for the app's second
+request, and the next candidates can be warmed in the background so a
+follow-up /api/plant-details/ call is a cache hit. Low-confidence matches
+get neither: the app asks for another photo instead.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .services import ServiceError, aget_plant_details, get_plant_details
+
+logger = logging.getLogger(__name__)
+
+
+def candidate_names(response_data, limit):
+    """Scientific names of the top `limit` matches, best first, without duplicates"""
+    names = []
+    for result in response_data.get("results", {}).get("results", []):
+        if len(names) >= limit:
+            break
+        name = result.get("scientific_name")
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+LOW_CONFIDENCE_ERROR = {
+    "error": "The match is too uncertain to describe; retake the photo",
+    "low_confidence": True,
+}
+
+
+def _details_error(e):
+    """A failed details lookup is reported next to, not instead of, the identification"""
+    if isinstance(e, ServiceError):
+        return {"details": None, "details_error": e.payload}
+    logger.error(f"Error getting plant details: {str(e)}", exc_info=True)
+    return {"details": None, "details_error": {"error": f"Failed to get plant details: {str(e)}"}}
+
+
+def _details_payload(plant_name):
+    try:
+        details, _ = get_plant_details(plant_name)
+        return {"details": details}
+    except Exception as e:
+        return _details_error(e)
+
+
+async def _adetails_payload(plant_name):
+    try:
+        details, _ = await aget_plant_details(plant_name)
+        return {"details": details}
+    except Exception as e:
+        return _details_error(e)
+
+
+_prefetch_executor = None
+_prefetch_executor_lock = threading.Lock()
+
+
+def _get_prefetch_executor():
+    global _prefetch_executor
+    if _prefetch_executor is None:
+        with _prefetch_executor_lock:
+            if _prefetch_executor is None:
+                _prefetch_executor = ThreadPoolExecutor(
+                    max_workers=settings.DETAILS_PREFETCH_WORKERS,
+                    thread_name_prefix="details-prefetch",
+                )
+    return _prefetch_executor
+
+
+def _prefetch_one(plant_name):
+    try:
+        get_plant_details(plant_name)
+    except Exception as e:
+        logger.warning(f"Prefetching details for {plant_name} failed: {str(e)}")
+    finally:
+        # Pool threads outlive requests, so nothing else closes their connections
+        close_old_connections()
+
+
+def prefetch_plant_details(plant_names):
+    """Warm the details cache for these plants without waiting for the result"""
+    for plant_name in plant_names:
+        logger.info(f"Prefetching details for {plant_name}")
+        _get_prefetch_executor().submit(_prefetch_one, plant_name)
+
+
+# Keeps fire-and-forget tasks referenced until they finish
+_background_tasks = set()
+
+
+async def _aprefetch_one(plant_name):
+    try:
+        await aget_plant_details(plant_name)
+    except Exception as e:
+        logger.warning(f"Prefetching details for {plant_name} failed: {str(e)}")
+
+
+def aprefetch_plant_details(plant_names):
+    """Async version of prefetch_plant_details; must be called from the event loop"""
+    for plant_name in plant_names:
+        logger.info(f"Prefetching details for {plant_name}")
+        task = asyncio.ensure_future(_aprefetch_one(plant_name))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+def _split_candidates(response_data, include_details):
+    """(name to describe now or None, names to prefetch)"""
+    if response_data.get("low_confidence"):
+        # Details of an unlikely match would be a wasted GROQ call
+        logger.info("Low confidence identification, not looking up details")
+        return None, []
+    limit = max(settings.DETAILS_PREFETCH_TOP_N, 1 if include_details else 0)
+    names = candidate_names(response_data, limit)
+    if include_details and names:
+        return names[0], names[1:]
+    return None, names
+
+
+def _low_confidence(response_data, include_details):
+    """The identification as it is, with a details_error saying why when details were asked for"""
+    if include_details and response_data.get("low_confidence"):
+        return {**response_data, "details": None, "details_error": LOW_CONFIDENCE_ERROR}
+    return response_data
+
+
+def describe(response_data, include_details=False):
+    """
+    Attach details for the top match when include_details is set and start
+    prefetching the other DETAILS_PREFETCH_TOP_N candidates.
+    """
+    top_name, prefetch_names = _split_candidates(response_data, include_details)
+    prefetch_plant_details(prefetch_names)
+    if top_name is None:
+        return _low_confidence(response_data, include_details)
+    return {**response_data, **_details_payload(top_name)}
+
+
+async def adescribe(response_data, include_details=False):
+    """Async version of describe"""
+    top_name, prefetch_names = _split_candidates(response_data, include_details)
+    aprefetch_plant_details(prefetch_names)
+    if top_name is None:
+        return _low_confidence(response_data, include_details)
+    return {**response_data, **await _adetails_payload(top_name)}
+
+
+def describe_events(response_data):
+    """
+    Push variant of describe for server-sent events: the identification is
+    sent at once and the details follow when they are ready.
+    """
+    top_name, prefetch_names = _split_candidates(response_data, True)
+    prefetch_plant_details(prefetch_names)
+    yield "identification", response_data
+    if top_name is not None:
+        yield "details", {"plant_name": top_name, **_details_payload(top_name)}
+    elif response_data.get("low_confidence"):
+        yield "details", {"plant_name": None, "details": None, "details_error": LOW_CONFIDENCE_ERROR}
+
+
+async def adescribe_events(response_data):
+    """Async version of describe_events"""
+    top_name, prefetch_names = _split_candidates(response_data, True)
+    aprefetch_plant_details(prefetch_names)
+    yield "identification", response_data
+    if top_name is not None:
+        yield "details", {"plant_name": top_name, **await _adetails_payload(top_name)}
+    elif response_data.get("low_confidence"):
+        yield "details", {"plant_name": None, "details": None, "details_error": LOW_CONFIDENCE_ERROR}
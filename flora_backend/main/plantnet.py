@@ -0,0 +1,229 @@
+# main/plantnet.py
+
+import asyncio
+import io
+import logging
+import threading
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+from .aio import LoopLocal
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CappedRetry(Retry):
+    """Retry that never sleeps longer than backoff_max, whatever Retry-After asks for"""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.backoff_max)
+
+
+class PlantNetError(Exception):
+    """PlantNet answered with a non-200 status"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_response(response):
+    """PlantNet JSON from a requests or httpx response, raising PlantNetError on failure"""
+    if response.status_code != 200:
+        try:
+            error_message = response.json().get("message", response.text)
+        except ValueError:
+            error_message = response.text
+        raise PlantNetError(error_message, status_code=response.status_code)
+    metrics.observe_payload("plantnet_response", len(response.content))
+    with metrics.timed("plantnet_parse"):
+        return response.json()
+
+
+class PlantNetClient:
+    """
+    Client for the PlantNet identify API that keeps its connections alive
+    between requests and retries connection failures and 429/5xx answers
+    """
+
+    def __init__(
+        self,
+        api_key,
+        base_url="https://my-api.plantnet.org",
+        project="all",
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=30,
+        max_retries=2,
+        backoff_factor=0.5,
+        max_backoff=5,
+    ):
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/v2/identify/{project}"
+        self.timeout = (connect_timeout, read_timeout)
+
+        # Read errors are not retried: PlantNet may already have counted the call.
+        # Waits, including PlantNet's Retry-After, are capped so a worker never
+        # sleeps far past its timeouts.
+        retry = CappedRetry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            backoff_max=max_backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def identify(self, images, organs=None, params=None):
+        """
+        Send one or more images of the same plant and return PlantNet's JSON.
+        Each image is a file object or a (filename, file, content_type) tuple.
+        """
+        files = [("images", image) for image in images]
+        data = {"organs": organs} if organs else None
+        query = {"api-key": self.api_key, **(params or {})}
+
+        response = self.session.post(
+            self.url, files=files, data=data, params=query, timeout=self.timeout
+        )
+        logger.info(f"PlantNet API response status: {response.status_code}")
+        return parse_response(response)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncPlantNetClient:
+    """httpx counterpart of PlantNetClient for the async views"""
+
+    def __init__(
+        self,
+        api_key,
+        base_url="https://my-api.plantnet.org",
+        project="all",
+        pool_size=100,
+        connect_timeout=3.05,
+        read_timeout=30,
+        max_retries=2,
+        backoff_factor=0.5,
+        max_backoff=5,
+    ):
+        import httpx
+
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/v2/identify/{project}"
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=limits,
+            # Transport retries cover connection failures only; statuses are retried below
+            transport=httpx.AsyncHTTPTransport(retries=max_retries, limits=limits),
+        )
+
+    def _retry_delay(self, attempt, response):
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(int(retry_after), self.max_backoff)
+        return min(self.backoff_factor * (2 ** attempt), self.max_backoff)
+
+    async def identify(self, images, organs=None, params=None):
+        """Same contract as PlantNetClient.identify; file objects are rewound on retry"""
+        files = [("images", image) for image in images]
+        data = {"organs": organs} if organs else None
+        query = {"api-key": self.api_key, **(params or {})}
+
+        for attempt in range(self.max_retries + 1):
+            response = await self.client.post(self.url, files=files, data=data, params=query)
+            logger.info(f"PlantNet API response status: {response.status_code}")
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+        return parse_response(response)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+@contextmanager
+def upload_part(uploaded_file):
+    """
+    Multipart part for a Django UploadedFile without an intermediate copy:
+    in-memory uploads are sent from a memoryview of their buffer, spooled
+    uploads straight from Django's temporary file.
+    """
+    name = uploaded_file.name or "image.jpg"
+    content_type = getattr(uploaded_file, "content_type", None) or "application/octet-stream"
+    fileobj = getattr(uploaded_file, "file", uploaded_file)
+    if isinstance(fileobj, io.BytesIO):
+        # The memoryview must be released before Django closes the BytesIO
+        with fileobj.getbuffer() as buffer:
+            yield (name, buffer, content_type)
+    else:
+        uploaded_file.seek(0)
+        yield (name, uploaded_file, content_type)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_plantnet_client():
+    """Process-wide PlantNet client built from settings"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PlantNetClient(
+                    settings.PLANTNET_API_KEY,
+                    base_url=settings.PLANTNET_API_URL,
+                    pool_size=settings.PLANTNET_POOL_SIZE,
+                    connect_timeout=settings.PLANTNET_CONNECT_TIMEOUT,
+                    read_timeout=settings.PLANTNET_READ_TIMEOUT,
+                    max_retries=settings.PLANTNET_MAX_RETRIES,
+                    backoff_factor=settings.PLANTNET_RETRY_BACKOFF,
+                    max_backoff=settings.PLANTNET_RETRY_MAX_BACKOFF,
+                )
+    return _client
+
+
+def _build_async_client():
+    return AsyncPlantNetClient(
+        settings.PLANTNET_API_KEY,
+        base_url=settings.PLANTNET_API_URL,
+        pool_size=settings.PLANTNET_MAX_CONCURRENCY,
+        connect_timeout=settings.PLANTNET_CONNECT_TIMEOUT,
+        read_timeout=settings.PLANTNET_READ_TIMEOUT,
+        max_retries=settings.PLANTNET_MAX_RETRIES,
+        backoff_factor=settings.PLANTNET_RETRY_BACKOFF,
+        max_backoff=settings.PLANTNET_RETRY_MAX_BACKOFF,
+    )
+
+
+_async_clients = LoopLocal(_build_async_client)
+
+
+def get_async_plantnet_client():
+    """PlantNet client bound to the running event loop"""
+    return _async_clients.get()
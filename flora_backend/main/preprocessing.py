@@ -0,0 +1,129 @@
+# main/preprocessing.py
+
+import asyncio
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+
+def preprocess_image(fileobj, max_edge=1280, image_format="JPEG", quality=85):
+    """
+    Apply EXIF orientation, shrink so the longest edge is at most max_edge and
+    re-encode. Returns (encoded bytes, stats).
+    """
+    from PIL import Image, ImageOps
+
+    started = time.perf_counter()
+    with Image.open(fileobj) as image:
+        original_size = image.size
+        # Let the JPEG decoder scale down by a power of two while decoding
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=quality, optimize=image_format == "JPEG")
+        processed_size = image.size
+
+    data = output.getvalue()
+    stats = {
+        "original_size": original_size,
+        "processed_size": processed_size,
+        "processed_bytes": len(data),
+        "seconds": time.perf_counter() - started,
+    }
+    return data, stats
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Bounded thread pool the async views resize on, so CPU-heavy resizes
+    can't pile up unbounded while the event loop waits for them
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_PREPROCESS_WORKERS or os.cpu_count(),
+                    thread_name_prefix="image-preprocess",
+                )
+    return _executor
+
+
+def _preprocess_upload(uploaded_file):
+    uploaded_file.seek(0)
+    try:
+        return preprocess_image(
+            uploaded_file,
+            max_edge=settings.IMAGE_MAX_EDGE,
+            image_format=settings.IMAGE_FORMAT,
+            quality=settings.IMAGE_QUALITY,
+        )
+    finally:
+        uploaded_file.seek(0)
+
+
+def _image_part(uploaded_file, data, stats):
+    stats["original_bytes"] = uploaded_file.size
+    metrics.observe_payload("preprocess_original", stats["original_bytes"])
+    metrics.observe_payload("preprocess_resized", stats["processed_bytes"])
+    logger.info(
+        f"Preprocessed image {stats['original_size']} -> {stats['processed_size']}, "
+        f"{stats['original_bytes']} -> {stats['processed_bytes']} bytes "
+        f"in {stats['seconds'] * 1000:.1f} ms"
+    )
+    if stats["processed_bytes"] >= stats["original_bytes"] and stats["processed_size"] == stats["original_size"]:
+        return None
+
+    base_name = os.path.splitext(uploaded_file.name or "image")[0]
+    image_format = settings.IMAGE_FORMAT
+    return (f"{base_name}.{EXTENSIONS[image_format]}", data, CONTENT_TYPES[image_format])
+
+
+def prepare_image_part(uploaded_file):
+    """
+    Multipart part with a downscaled copy of the upload, made in the calling
+    thread. Returns None when the image can't be processed or re-encoding
+    would not make it smaller, so the caller sends the original.
+    """
+    try:
+        with metrics.timed("preprocess"):
+            data, stats = _preprocess_upload(uploaded_file)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending original: {str(e)}")
+        return None
+    return _image_part(uploaded_file, data, stats)
+
+
+async def aprepare_image_part(uploaded_file):
+    """Async version of prepare_image_part; the resize runs on the preprocessing pool"""
+    try:
+        with metrics.timed("preprocess"):
+            future = get_executor().submit(_preprocess_upload, uploaded_file)
+            data, stats = await asyncio.wrap_future(future)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending original: {str(e)}")
+        return None
+    return _image_part(uploaded_file, data, stats)
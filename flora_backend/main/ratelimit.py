@@ -0,0 +1,349 @@
+# main/ratelimit.py
+
+"""
+Upstream governor: a token bucket per API key, shared by every process on
+the host, and a circuit breaker that stops calling an upstream that keeps
+failing so requests fail fast instead of waiting on it.
+"""
+
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    In-process token bucket: refills at `rate` tokens per second and holds at
+    most `capacity`. A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; returns seconds to wait otherwise (0 on success)"""
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1, timeout=None):
+        """Wait until tokens are available; False if that would exceed timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket kept in a SQLite file, so every worker process on the host
+    draws from the same budget. Each refill-and-take runs in an IMMEDIATE
+    transaction, which serializes it across processes.
+    """
+
+    def __init__(self, path, name, rate, capacity=None):
+        super().__init__(rate, capacity)
+        self.path = str(path)
+        self.name = name
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def try_acquire(self, tokens=1):
+        if not self.rate:
+            return 0
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            available = self.capacity
+            if row is not None:
+                available = min(self.capacity, row[0] + max(now - row[1], 0) * self.rate)
+            wait = 0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / self.rate
+            conn.execute(
+                "INSERT INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (self.name, available, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. Then a single trial call is let through
+    (half-open): success closes the breaker, failure opens it again.
+    A threshold of 0 disables the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until calls are let through again (0 if they are now)"""
+        if self.state != self.OPEN:
+            return 0
+        return max(self._opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    def allow(self):
+        if not self.threshold:
+            return True
+        with self._lock:
+            if self.state == self.OPEN and not self.retry_after():
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def cancel(self):
+        """An allowed call did not go out after all; let another trial through"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        """Returns True when this failure opened the breaker"""
+        if not self.threshold:
+            return False
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+                return opened
+            return False
+
+
+class UpstreamUnavailable(Exception):
+    """A call was throttled or short-circuited before it reached the upstream"""
+
+    THROTTLED = "throttled"
+    SHORT_CIRCUITED = "short_circuited"
+
+    def __init__(self, upstream, reason, retry_after):
+        super().__init__(f"{upstream} {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class UpstreamGovernor:
+    """
+    Gate in front of one upstream API. Calls wait up to `max_wait` seconds
+    for a rate-limit token, then are rejected as throttled; while the circuit
+    breaker is open they are rejected at once as short-circuited.
+    `is_failure(exc)` decides which exceptions count against the breaker.
+    """
+
+    def __init__(self, name, bucket, breaker, max_wait=0, is_failure=None):
+        self.name = name
+        self.bucket = bucket
+        self.breaker = breaker
+        self.max_wait = max_wait
+        self.is_failure = is_failure or (lambda exc: True)
+        self.counters = {"allowed": 0, "throttled": 0, "short_circuited": 0, "failures": 0, "opened": 0}
+        self._counters_lock = threading.Lock()
+
+    def _count(self, counter):
+        metrics.count_governor(self.name, counter)
+        with self._counters_lock:
+            self.counters[counter] += 1
+
+    def _short_circuit(self):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            retry_after = self.breaker.retry_after() or 1
+            logger.warning(f"{self.name} circuit open, failing fast")
+            raise UpstreamUnavailable(self.name, UpstreamUnavailable.SHORT_CIRCUITED, retry_after)
+
+    def _take_token(self):
+        """Seconds to wait for a token; 0 once taken. Never fails a call over a bucket error."""
+        try:
+            return self.bucket.try_acquire()
+        except sqlite3.Error as e:
+            logger.warning(f"{self.name} rate limiter unavailable: {str(e)}")
+            return 0
+
+    def _throttle(self, wait):
+        self.breaker.cancel()
+        self._count("throttled")
+        logger.warning(f"{self.name} rate limit reached, rejecting call")
+        raise UpstreamUnavailable(self.name, UpstreamUnavailable.THROTTLED, wait)
+
+    def before_call(self):
+        """Wait for a token and check the breaker, raising UpstreamUnavailable if the call can't go out"""
+        self._short_circuit()
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self._take_token()
+            if not wait:
+                break
+            if time.monotonic() + wait > deadline:
+                self._throttle(wait)
+            time.sleep(wait)
+        self._count("allowed")
+
+    async def abefore_call(self):
+        """Async version of before_call"""
+        self._short_circuit()
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = await asyncio.to_thread(self._take_token)
+            if not wait:
+                break
+            if time.monotonic() + wait > deadline:
+                self._throttle(wait)
+            await asyncio.sleep(wait)
+        self._count("allowed")
+
+    def record(self, exc=None):
+        """Feed the outcome of a call to the breaker"""
+        if exc is not None and self.is_failure(exc):
+            self._count("failures")
+            if self.breaker.record_failure():
+                self._count("opened")
+                logger.error(f"{self.name} circuit opened after repeated failures")
+        else:
+            self.breaker.record_success()
+
+    @contextmanager
+    def track(self):
+        """Record the outcome of the enclosed call (before_call already done)"""
+        try:
+            yield
+        except BaseException as e:
+            self.record(e)
+            raise
+        self.record()
+
+    @asynccontextmanager
+    async def atrack(self):
+        try:
+            yield
+        except BaseException as e:
+            self.record(e)
+            raise
+        self.record()
+
+    @contextmanager
+    def call(self):
+        self.before_call()
+        with self.track():
+            yield
+
+    @asynccontextmanager
+    async def acall(self):
+        await self.abefore_call()
+        async with self.atrack():
+            yield
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "state": self.breaker.state if self.breaker.threshold else "disabled",
+            "retry_after": round(self.breaker.retry_after(), 1),
+        }
+
+
+def _bucket_name(name, api_key):
+    """Buckets are per API key, without storing the key itself"""
+    key_hash = hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+    return f"{name}:{key_hash}"
+
+
+def build_governor(name, api_key, is_failure=None):
+    """Governor for an upstream from the <NAME>_RATE_LIMIT* and <NAME>_BREAKER_* settings"""
+    prefix = name.upper()
+    rate = getattr(settings, f"{prefix}_RATE_LIMIT")
+    capacity = getattr(settings, f"{prefix}_RATE_LIMIT_BURST") or None
+    bucket = None
+    if rate and settings.RATE_LIMIT_BACKEND == "sqlite":
+        try:
+            bucket = SharedTokenBucket(
+                settings.RATE_LIMIT_SQLITE_PATH, _bucket_name(name, api_key), rate, capacity
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared rate limiter unavailable, limiting per process: {str(e)}")
+    if bucket is None:
+        bucket = TokenBucket(rate, capacity)
+    breaker = CircuitBreaker(
+        threshold=getattr(settings, f"{prefix}_BREAKER_THRESHOLD"),
+        reset_timeout=getattr(settings, f"{prefix}_BREAKER_RESET"),
+    )
+    return UpstreamGovernor(
+        name,
+        bucket,
+        breaker,
+        max_wait=getattr(settings, f"{prefix}_RATE_LIMIT_WAIT"),
+        is_failure=is_failure,
+    )
@@ -6,5 +6,13 @@ from .models import IdentifiedPlant
 class IdentifiedPlantSerializer(serializers.ModelSerializer):
     class Meta:
         model = IdentifiedPlant
-        fields = ['id', 'image', 'best_match_scientific_name', 'best_match_common_names', 'results', 'created_at']
-        read_only_fields = ['id', 'created_at', 'best_match_scientific_name', 'best_match_common_names', 'results'] 
\ No newline at end of file
+        fields = ['id', 'image', 'thumbnail', 'best_match_scientific_name', 'best_match_common_names', 'results', 'status', 'error', 'created_at']
+        read_only_fields = ['id', 'thumbnail', 'created_at', 'best_match_scientific_name', 'best_match_common_names', 'results', 'status', 'error']
+
+
+class IdentifiedPlantListSerializer(serializers.ModelSerializer):
+    """Compact rows for history listings; the full results stay on the detail endpoint"""
+    class Meta:
+        model = IdentifiedPlant
+        fields = ['id', 'image', 'thumbnail', 'best_match_scientific_name', 'status', 'created_at']
+        read_only_fields = fields
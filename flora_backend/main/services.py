@@ -0,0 +1,860 @@
+# main/services.py
+
+import json
+import logging
+import math
+import threading
+import urllib.parse
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .aio import LoopLocal, upstream_limiter
+from .cache import get_details_cache, get_identification_cache
+from .classifier import BackendUnavailable, IdentificationBackend, get_local_classifier
+from .details_store import get_stored_details
+from .plantnet import (
+    PlantNetError,
+    get_async_plantnet_client,
+    get_plantnet_client,
+    upload_part,
+)
+from .preprocessing import aprepare_image_part, prepare_image_part
+from .ratelimit import UpstreamUnavailable, build_governor
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .species import get_species_index
+from .streaming import SectionParser, json_object_text
+
+logger = logging.getLogger(__name__)
+
+GROQ_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+# Bump when the prompt changes so cached details from the old prompt are not served
+DETAILS_PROMPT_VERSION = 1
+DETAILS_SYSTEM_PROMPT = "You are a plant instructor in an app called FLORA. You'll be provided with the name of a specific plant. Provide information in these categories: 'introduction' (brief overview), 'history' (origins and cultural significance), 'facts' (list of interesting facts as an array), and 'usage' (list of ways the plant is used as an array). Answer in JSON format only."
+
+
+class ServiceError(Exception):
+    """A failure that maps directly to an API error response"""
+
+    def __init__(self, payload, status_code, headers=None):
+        super().__init__(payload.get("error"))
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def lookup_species(plant_name):
+    """Species index entry for a name ({"scientific_name", "common_names", "match"}), or None"""
+    index = get_species_index()
+    if not index or not plant_name:
+        return None
+    try:
+        return index.resolve(plant_name)
+    except Exception as e:
+        logger.warning(f"Species lookup failed for {plant_name}: {str(e)}")
+        return None
+
+
+def canonical_plant_name(plant_name):
+    """
+    The scientific name for any known name of a plant ("rose", "Rose " and
+    "Rosa" all give "Rosa"), so they share one details cache entry and GROQ
+    call. Unknown names are returned with their whitespace tidied.
+    """
+    species = lookup_species(plant_name)
+    if species:
+        if species["scientific_name"] != plant_name:
+            logger.info(f"Resolved '{plant_name}' to {species['scientific_name']}")
+        return species["scientific_name"]
+    return " ".join(plant_name.split())
+
+
+def build_purchase_links(plant_name):
+    """Search links for buying seeds or plants of a species"""
+    encoded_plant_name = urllib.parse.quote_plus(plant_name)
+    return [
+        {
+            "site_name": "Google Shopping",
+            "url": f"https://www.google.com/search?tbm=shop&q={encoded_plant_name}"
+        },
+        {
+            "site_name": "Amazon",
+            "url": f"https://www.amazon.in/s?k={encoded_plant_name}"
+        },
+        {
+            "site_name": "Etsy",
+            "url": f"https://www.etsy.com/search?q={encoded_plant_name}"
+        },
+        # Add more sites if desired
+    ]
+
+
+def select_candidates(results):
+    """
+    The IDENTIFY_TOP_K best of PlantNet's results (best first) that score at
+    least IDENTIFY_MIN_SCORE. The best one is kept whatever its score.
+    """
+    min_score = settings.IDENTIFY_MIN_SCORE
+    if min_score:
+        results = results[:1] + [result for result in results[1:] if (result.get("score") or 0) >= min_score]
+    if settings.IDENTIFY_TOP_K:
+        results = results[:settings.IDENTIFY_TOP_K]
+    return results
+
+
+def plantnet_params():
+    """Query parameters for PlantNet identify calls"""
+    return {"nb-results": settings.IDENTIFY_TOP_K} if settings.IDENTIFY_TOP_K else {}
+
+
+def is_low_confidence(results):
+    """Whether the best candidate scores below IDENTIFY_LOW_CONFIDENCE_SCORE"""
+    threshold = settings.IDENTIFY_LOW_CONFIDENCE_SCORE
+    candidates = results.get("results") or []
+    if not threshold or not candidates:
+        return False
+    score = candidates[0].get("score")
+    return score is not None and score < threshold
+
+
+def extract_results(plantnet_data):
+    """Results in the backend format ({"best_match", "results"}) from a raw PlantNet response"""
+    best_match_scientific = plantnet_data.get("bestMatch")
+    results = select_candidates(plantnet_data.get("results", []))
+
+    if not results:
+        logger.warning("No results found in PlantNet response")
+        raise ServiceError({"error": "No plant matches found"}, 404)
+
+    extracted_results = []
+    for result in results:
+        species_data = result.get("species", {})
+        common_names = species_data.get("commonNames", [])
+        scientific_name = species_data.get("scientificNameWithoutAuthor") # Often cleaner than scientificName
+        if not scientific_name:
+           scientific_name = species_data.get("scientificName") # Fallback
+        score = result.get("score")
+
+        extracted_result = {
+            "scientific_name": scientific_name,
+            "common_names": common_names,
+            "score": score,
+        }
+        extracted_results.append(extracted_result)
+
+    return {
+        "best_match": best_match_scientific,
+        "results": extracted_results,
+    }
+
+
+def extract_identification(plantnet_data):
+    """Turn a raw PlantNet response into the /api/identify/ response body"""
+    return identification_body(extract_results(plantnet_data))
+
+
+def identification_body(results):
+    """
+    Full /api/identify/ response body from the extracted results (the part
+    stored in IdentifiedPlant.results)
+    """
+    best_match_scientific = results.get("best_match")
+    top_result = results["results"][0] if results.get("results") else {}
+    first_result_common_names = top_result.get("common_names") or []
+    first_result_scientific_name = top_result.get("scientific_name")
+    if not first_result_common_names:
+        # PlantNet has no common name for many species; the local index often does
+        species = lookup_species(first_result_scientific_name or best_match_scientific)
+        if species:
+            first_result_common_names = species["common_names"]
+
+    # --- Determine the best name to use for search links ---
+    # Prioritize common name if available, otherwise use scientific name
+    plant_name_for_search = None
+    if first_result_common_names:
+        plant_name_for_search = first_result_common_names[0] # Use the first common name
+    elif best_match_scientific:
+         plant_name_for_search = best_match_scientific
+    elif first_result_scientific_name:
+        plant_name_for_search = first_result_scientific_name
+
+    if plant_name_for_search:
+        logger.info(f"Using '{plant_name_for_search}' for purchase links.")
+        purchase_links = build_purchase_links(plant_name_for_search)
+    else:
+        logger.warning("Could not determine a suitable plant name for search links.")
+        purchase_links = [] # Return empty list if no name found
+
+    return {
+        "best_match_scientific_name": first_result_scientific_name or best_match_scientific,
+        "best_match_common_names": ", ".join(first_result_common_names),
+        "results": results,
+        "purchase_links": purchase_links,
+        "low_confidence": is_low_confidence(results),
+    }
+
+
+def _check_plantnet_key():
+    if not settings.PLANTNET_API_KEY:
+        logger.error("PlantNet API key not found in settings")
+        raise ServiceError({"error": "PlantNet API key not configured"}, 500)
+
+
+def _plantnet_error(e):
+    logger.error(f"PlantNet API error: {str(e)}")
+    # Only PlantNet's own 4xx answers are the client's fault; overload and outages
+    # are gateway errors, so callers (and queued jobs) know to try again
+    if e.status_code == 429:
+        return ServiceError({"error": "PlantNet API is over capacity", "details": str(e)}, 503)
+    if _plantnet_failure(e):
+        return ServiceError({"error": "PlantNet API failed", "details": str(e)}, 502)
+    return ServiceError(
+        {"error": "Bad Request to PlantNet API", "details": str(e)}, 400
+    )
+
+
+def _network_error(e):
+    logger.error(f"Network error: {str(e)}")
+    return ServiceError({"error": f"Network error: {str(e)}"}, 500)
+
+
+def _plantnet_failure(exc):
+    """Errors that mean PlantNet is unhealthy, as opposed to a bad image or an unknown plant"""
+    import httpx
+
+    if isinstance(exc, PlantNetError):
+        return exc.status_code is None or exc.status_code == 429 or exc.status_code >= 500
+    return isinstance(exc, (requests.exceptions.RequestException, httpx.HTTPError))
+
+
+def _groq_failure(exc):
+    """Errors that mean GROQ is unhealthy or over quota"""
+    import groq
+
+    if isinstance(exc, groq.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return isinstance(exc, groq.APIConnectionError)
+
+
+UPSTREAM_LABELS = {"plantnet": "PlantNet", "groq": "GROQ"}
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def _get_governor(name, api_key, is_failure):
+    governor = _governors.get(name)
+    if governor is None:
+        with _governors_lock:
+            governor = _governors.get(name)
+            if governor is None:
+                governor = _governors[name] = build_governor(name, api_key, is_failure)
+    return governor
+
+
+def plantnet_governor():
+    """Rate limit and circuit breaker for PlantNet calls in this process"""
+    return _get_governor("plantnet", settings.PLANTNET_API_KEY, _plantnet_failure)
+
+
+def groq_governor():
+    """Rate limit and circuit breaker for GROQ calls in this process"""
+    return _get_governor("groq", settings.GROQ_API_KEY, _groq_failure)
+
+
+def upstream_stats():
+    """Governor counters and breaker state per upstream"""
+    return {
+        "plantnet": plantnet_governor().stats(),
+        "groq": groq_governor().stats(),
+    }
+
+
+def _unavailable_error(e):
+    label = UPSTREAM_LABELS.get(e.upstream, e.upstream)
+    retry_after = max(math.ceil(e.retry_after), 1)
+    if e.reason == UpstreamUnavailable.THROTTLED:
+        payload, status_code = {"error": f"{label} rate limit reached, try again later"}, 429
+    else:
+        payload, status_code = {"error": f"{label} is temporarily unavailable"}, 503
+    payload["retry_after"] = retry_after
+    return ServiceError(payload, status_code, headers={"Retry-After": str(retry_after)})
+
+
+@contextmanager
+def _governed(governor):
+    """governor.call() with rejections raised as 429/503 ServiceErrors"""
+    try:
+        governor.before_call()
+    except UpstreamUnavailable as e:
+        raise _unavailable_error(e)
+    with governor.track():
+        yield
+
+
+@asynccontextmanager
+async def _agoverned(governor):
+    try:
+        await governor.abefore_call()
+    except UpstreamUnavailable as e:
+        raise _unavailable_error(e)
+    async with governor.atrack():
+        yield
+
+
+def identify_upload(uploaded_image, organ=None):
+    """
+    Identify an uploaded image, serving repeat uploads from the identification
+    cache. organ optionally names what the photo shows ("leaf", "flower",
+    ...). Returns (response_data, cache_status) where cache_status is
+    "HIT", "MISS" or None when caching is disabled.
+    """
+    return identify_images([uploaded_image], [organ] if organ else None)
+
+
+class PlantNetBackend(IdentificationBackend):
+    """Identification through the PlantNet API"""
+
+    name = "plantnet"
+
+    def identify(self, uploaded_images, organs=None):
+        _check_plantnet_key()
+
+        # Forward uploads as-is: in-memory uploads are sent from their buffer,
+        # only uploads above FILE_UPLOAD_MAX_MEMORY_SIZE were spooled to disk by Django
+        for uploaded_image in uploaded_images:
+            logger.info(f"Calling PlantNet API with image: {uploaded_image.name} ({uploaded_image.size} bytes)")
+        try:
+            with ExitStack() as stack:
+                image_parts = []
+                for uploaded_image in uploaded_images:
+                    prepared_part = None
+                    if settings.IMAGE_PREPROCESSING:
+                        prepared_part = prepare_image_part(uploaded_image)
+                    if not prepared_part:
+                        prepared_part = stack.enter_context(upload_part(uploaded_image))
+                    image_parts.append(prepared_part)
+                with _governed(plantnet_governor()), metrics.upstream_call("plantnet", "plantnet_request"):
+                    plantnet_data = get_plantnet_client().identify(
+                        image_parts, organs=organs, params=plantnet_params()
+                    )
+        except PlantNetError as e:
+            raise _plantnet_error(e)
+        except requests.exceptions.RequestException as e:
+            raise _network_error(e)
+        logger.info("Successfully received PlantNet data")
+        with metrics.timed("plantnet_extract"):
+            return extract_results(plantnet_data)
+
+    async def aidentify(self, uploaded_images, organs=None):
+        import httpx
+
+        _check_plantnet_key()
+
+        for uploaded_image in uploaded_images:
+            logger.info(f"Calling PlantNet API with image: {uploaded_image.name} ({uploaded_image.size} bytes)")
+        try:
+            image_parts = []
+            for uploaded_image in uploaded_images:
+                image_part = None
+                if settings.IMAGE_PREPROCESSING:
+                    image_part = await aprepare_image_part(uploaded_image)
+                if not image_part:
+                    uploaded_image.seek(0)
+                    image_part = (
+                        uploaded_image.name or "image.jpg",
+                        uploaded_image,
+                        uploaded_image.content_type or "application/octet-stream",
+                    )
+                image_parts.append(image_part)
+            async with upstream_limiter("plantnet"), _agoverned(plantnet_governor()):
+                with metrics.upstream_call("plantnet", "plantnet_request"):
+                    plantnet_data = await get_async_plantnet_client().identify(
+                        image_parts, organs=organs, params=plantnet_params()
+                    )
+        except PlantNetError as e:
+            raise _plantnet_error(e)
+        except httpx.HTTPError as e:
+            raise _network_error(e)
+        logger.info("Successfully received PlantNet data")
+        with metrics.timed("plantnet_extract"):
+            return extract_results(plantnet_data)
+
+
+# Short names usable in IDENTIFY_BACKENDS; anything else is a dotted path to
+# an IdentificationBackend subclass or factory
+BACKEND_FACTORIES = {
+    "plantnet": PlantNetBackend,
+    "local": get_local_classifier,
+}
+
+_backends = None
+_backends_lock = threading.Lock()
+
+
+def get_identification_backends():
+    """Backends named in IDENTIFY_BACKENDS, in order; unavailable ones are left out"""
+    global _backends
+    if _backends is None:
+        with _backends_lock:
+            if _backends is None:
+                backends = []
+                for name in settings.IDENTIFY_BACKENDS:
+                    factory = BACKEND_FACTORIES.get(name) or import_string(name)
+                    try:
+                        backends.append(factory())
+                    except BackendUnavailable as e:
+                        logger.warning(f"Identification backend {name} disabled: {str(e)}")
+                if not backends:
+                    backends.append(PlantNetBackend())
+                _backends = backends
+    return _backends
+
+
+def _backend_failed(backend, e, fallback):
+    """
+    Whether to answer with the fallback results after a backend failed,
+    rather than raise. Anything but "no match" counts, so a less confident
+    local answer is still given while PlantNet is down or unreachable.
+    """
+    if isinstance(e, ServiceError) and e.status_code == 404:
+        return False
+    if fallback is not None and settings.IDENTIFY_BACKENDS_FALLBACK:
+        logger.warning(f"{backend.name} failed ({str(e)}), answering with {fallback['source']} results")
+        return True
+    return False
+
+
+def identify_with_backends(uploaded_images, organs=None):
+    """
+    Ask the configured backends in order and return the results of the first
+    confident one (the last backend is always taken at its word).
+    """
+    backends = get_identification_backends()
+    fallback = None
+    for index, backend in enumerate(backends):
+        is_last = index == len(backends) - 1
+        try:
+            with metrics.timed(f"identify_{backend.name}"):
+                results = backend.identify(uploaded_images, organs)
+        except Exception as e:
+            if not is_last and not isinstance(e, ServiceError):
+                logger.error(f"{backend.name} backend error: {str(e)}", exc_info=True)
+                continue
+            if _backend_failed(backend, e, fallback):
+                return fallback
+            raise
+        results["source"] = backend.name
+        if is_last or backend.is_confident(results):
+            logger.info(f"Identified by {backend.name}")
+            return results
+        fallback = fallback or results
+    return fallback
+
+
+async def aidentify_with_backends(uploaded_images, organs=None):
+    """Async version of identify_with_backends"""
+    backends = get_identification_backends()
+    fallback = None
+    for index, backend in enumerate(backends):
+        is_last = index == len(backends) - 1
+        try:
+            with metrics.timed(f"identify_{backend.name}"):
+                results = await backend.aidentify(uploaded_images, organs)
+        except Exception as e:
+            if not is_last and not isinstance(e, ServiceError):
+                logger.error(f"{backend.name} backend error: {str(e)}", exc_info=True)
+                continue
+            if _backend_failed(backend, e, fallback):
+                return fallback
+            raise
+        results["source"] = backend.name
+        if is_last or backend.is_confident(results):
+            logger.info(f"Identified by {backend.name}")
+            return results
+        fallback = fallback or results
+    return fallback
+
+
+def identify_images(uploaded_images, organs=None):
+    """
+    identify_upload for several images of the same plant, which are
+    identified together in one call. organs optionally names the organ shown
+    in each image ("leaf", "flower", ...).
+    """
+    for uploaded_image in uploaded_images:
+        metrics.observe_payload("upload", uploaded_image.size)
+    cache = get_identification_cache()
+    cache_keys = []
+    if cache:
+        with metrics.timed("identify_cache"):
+            cache_keys = cache.keys_for_images(uploaded_images, organs)
+            cached_data = cache.lookup(cache_keys)
+        if cached_data is not None:
+            logger.info(f"Identification cache hit: {cache_keys[0]}")
+            return cached_data, "HIT"
+
+    response_data = identification_body(identify_with_backends(uploaded_images, organs))
+    if cache:
+        cache.store(cache_keys, response_data)
+        return response_data, "MISS"
+    return response_data, None
+
+
+async def aidentify_upload(uploaded_image, organ=None):
+    """Async version of identify_upload for the ASGI views"""
+    metrics.observe_payload("upload", uploaded_image.size)
+    organs = [organ] if organ else None
+    cache = get_identification_cache()
+    cache_keys = []
+    if cache:
+        # Hashing and disk-backed cache lookups stay off the event loop
+        with metrics.timed("identify_cache"):
+            cache_keys = await sync_to_async(cache.keys_for_images, thread_sensitive=False)(
+                [uploaded_image], organs
+            )
+            cached_data = await sync_to_async(cache.lookup, thread_sensitive=False)(cache_keys)
+        if cached_data is not None:
+            logger.info(f"Identification cache hit: {cache_keys[0]}")
+            return cached_data, "HIT"
+
+    response_data = identification_body(await aidentify_with_backends([uploaded_image], organs))
+    if cache:
+        await sync_to_async(cache.store, thread_sensitive=False)(cache_keys, response_data)
+        return response_data, "MISS"
+    return response_data, None
+
+
+def details_request(plant_name, stream=False):
+    """Chat-completion arguments for a plant-details query"""
+    kwargs = {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": DETAILS_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Tell me about {plant_name}"},
+        ],
+        "temperature": 1,
+        "max_tokens": 1024,
+        "top_p": 1,
+        "response_format": {"type": "json_object"},
+    }
+    if stream:
+        # GROQ's JSON mode can't be streamed; the system prompt still asks for JSON only
+        kwargs["stream"] = True
+        del kwargs["response_format"]
+    return kwargs
+
+
+def parse_details(groq_data):
+    """Parse the GROQ response to ensure it's valid JSON"""
+    try:
+        with metrics.timed("groq_parse"):
+            return json.loads(groq_data)
+    except json.JSONDecodeError:
+        logger.error(f"Invalid JSON in GROQ response: {groq_data}")
+        raise ServiceError(
+            {
+                "error": "Invalid response format from GROQ API",
+                "raw_response": groq_data,
+            },
+            500,
+        )
+
+
+def _check_groq_key():
+    if not settings.GROQ_API_KEY:
+        logger.error("GROQ API key not found in settings")
+        raise ServiceError({"error": "GROQ API key not configured"}, 500)
+
+
+_groq_client = None
+_groq_client_lock = threading.Lock()
+
+
+def get_groq_client():
+    """Process-wide GROQ client, so connections are reused across requests"""
+    global _groq_client
+    if _groq_client is None:
+        with _groq_client_lock:
+            if _groq_client is None:
+                from groq import Groq
+
+                with metrics.timed("groq_client_init"):
+                    _groq_client = Groq(
+                        api_key=settings.GROQ_API_KEY,
+                        base_url=settings.GROQ_API_URL,
+                        timeout=settings.GROQ_TIMEOUT,
+                    )
+    return _groq_client
+
+
+def _build_async_groq_client():
+    from groq import AsyncGroq
+
+    return AsyncGroq(
+        api_key=settings.GROQ_API_KEY,
+        base_url=settings.GROQ_API_URL,
+        timeout=settings.GROQ_TIMEOUT,
+    )
+
+
+_async_groq_clients = LoopLocal(_build_async_groq_client)
+
+
+def get_async_groq_client():
+    """GROQ client bound to the running event loop"""
+    return _async_groq_clients.get()
+
+
+def normalize_plant_name(plant_name):
+    """Case- and whitespace-insensitive form of a plant name"""
+    return " ".join(plant_name.split()).casefold()
+
+
+def details_cache_key(plant_name):
+    return f"{GROQ_MODEL}:v{DETAILS_PROMPT_VERSION}:{normalize_plant_name(plant_name)}"
+
+
+def fetch_plant_details(plant_name):
+    """Ask GROQ for the introduction/history/facts/usage of a plant"""
+    _check_groq_key()
+
+    logger.info(f"Calling GROQ API for details about {plant_name}")
+    with _governed(groq_governor()), metrics.upstream_call("groq", "groq_completion"):
+        completion = get_groq_client().chat.completions.create(**details_request(plant_name))
+
+    groq_data = completion.choices[0].message.content
+    logger.info("Successfully received GROQ data")
+    return parse_details(groq_data)
+
+
+async def afetch_plant_details(plant_name):
+    """Async version of fetch_plant_details"""
+    _check_groq_key()
+
+    logger.info(f"Calling GROQ API for details about {plant_name}")
+    async with upstream_limiter("groq"), _agoverned(groq_governor()):
+        with metrics.upstream_call("groq", "groq_completion"):
+            completion = await get_async_groq_client().chat.completions.create(
+                **details_request(plant_name)
+            )
+
+    groq_data = completion.choices[0].message.content
+    logger.info("Successfully received GROQ data")
+    return parse_details(groq_data)
+
+
+_details_flights = SingleFlight()
+_async_details_flights = AsyncSingleFlight()
+
+
+def get_plant_details(plant_name):
+    """
+    Plant details from the precomputed store or the details cache, falling
+    back to GROQ. Concurrent misses for the same plant share a single GROQ
+    call. Returns (details, cache_status) like identify_upload, with
+    cache_status "STORE" for precomputed details.
+    """
+    plant_name = canonical_plant_name(plant_name)
+    cache = get_details_cache()
+    key = details_cache_key(plant_name)
+    stored_data = get_stored_details(key)
+    if stored_data is not None:
+        logger.info(f"Plant details served from store: {key}")
+        return stored_data, "STORE"
+    if cache:
+        with metrics.timed("details_cache"):
+            cached_data = cache.get(key)
+        if cached_data is not None:
+            logger.info(f"Plant details cache hit: {key}")
+            return cached_data, "HIT"
+
+    def load():
+        details = fetch_plant_details(plant_name)
+        if cache:
+            cache.set(key, details)
+        return details
+
+    return _details_flights.do(key, load), "MISS" if cache else None
+
+
+async def aget_plant_details(plant_name):
+    """Async version of get_plant_details"""
+    plant_name = await sync_to_async(canonical_plant_name, thread_sensitive=False)(plant_name)
+    cache = get_details_cache()
+    key = details_cache_key(plant_name)
+    stored_data = await sync_to_async(get_stored_details)(key)
+    if stored_data is not None:
+        logger.info(f"Plant details served from store: {key}")
+        return stored_data, "STORE"
+    if cache:
+        with metrics.timed("details_cache"):
+            cached_data = await sync_to_async(cache.get, thread_sensitive=False)(key)
+        if cached_data is not None:
+            logger.info(f"Plant details cache hit: {key}")
+            return cached_data, "HIT"
+
+    async def load():
+        details = await afetch_plant_details(plant_name)
+        if cache:
+            await sync_to_async(cache.set, thread_sensitive=False)(key, details)
+        return details
+
+    return await _async_details_flights.do(key, load), "MISS" if cache else None
+
+
+def _replay_details(details):
+    for name, value in details.items():
+        yield "section", {"name": name, "value": value}
+    yield "done", details
+
+
+async def _areplay_details(details):
+    for event in _replay_details(details):
+        yield event
+
+
+def _chunk_text(chunk):
+    return chunk.choices[0].delta.content if chunk.choices else None
+
+
+class _GovernedStream:
+    """
+    A GROQ details stream whose governor check ran before the response
+    started, so throttling is still reported as 429/503. The call itself
+    only goes out on the first item; if the stream is closed or dropped
+    before that, the breaker's half-open trial slot is handed back so the
+    next call can make the trial instead.
+    """
+
+    def __init__(self, governor, stream):
+        self.governor = governor
+        self.stream = stream
+        self.started = False
+
+    def _release(self):
+        if not self.started:
+            self.started = True
+            self.governor.breaker.cancel()
+
+    def __del__(self):
+        self._release()
+
+
+class _SyncGovernedStream(_GovernedStream):
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.started = True
+        return next(self.stream)
+
+    def close(self):
+        self._release()
+        self.stream.close()
+
+
+class _AsyncGovernedStream(_GovernedStream):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self.started = True
+        return await self.stream.__anext__()
+
+    async def aclose(self):
+        self._release()
+        await self.stream.aclose()
+
+
+def _stream_details(plant_name, cache, key):
+    logger.info(f"Streaming GROQ details about {plant_name}")
+    with groq_governor().track(), metrics.upstream_call("groq", "groq_stream"):
+        stream = get_groq_client().chat.completions.create(**details_request(plant_name, stream=True))
+        parser = SectionParser()
+        for chunk in stream:
+            delta = _chunk_text(chunk)
+            if not delta:
+                continue
+            yield "token", {"delta": delta}
+            for name, value in parser.feed(delta):
+                yield "section", {"name": name, "value": value}
+
+    details = parse_details(json_object_text(parser.buffer))
+    if cache:
+        cache.set(key, details)
+    yield "done", details
+
+
+async def _astream_details(plant_name, cache, key):
+    logger.info(f"Streaming GROQ details about {plant_name}")
+    async with upstream_limiter("groq"), groq_governor().atrack():
+        with metrics.upstream_call("groq", "groq_stream"):
+            stream = await get_async_groq_client().chat.completions.create(
+                **details_request(plant_name, stream=True)
+            )
+            parser = SectionParser()
+            async for chunk in stream:
+                delta = _chunk_text(chunk)
+                if not delta:
+                    continue
+                yield "token", {"delta": delta}
+                for name, value in parser.feed(delta):
+                    yield "section", {"name": name, "value": value}
+
+    details = parse_details(json_object_text(parser.buffer))
+    if cache:
+        await sync_to_async(cache.set, thread_sensitive=False)(key, details)
+    yield "done", details
+
+
+def stream_plant_details(plant_name):
+    """
+    Plant details as an iterator of (event, data) pairs: "token" for each
+    piece of model output, "section" as each top-level field completes and
+    "done" with the full details. Stored and cached details are replayed as
+    sections. Configuration errors are raised before the stream starts.
+    """
+    plant_name = canonical_plant_name(plant_name)
+    cache = get_details_cache()
+    key = details_cache_key(plant_name)
+    cached_data = get_stored_details(key)
+    if cached_data is None and cache:
+        cached_data = cache.get(key)
+    if cached_data is not None:
+        logger.info(f"Plant details cache hit: {key}")
+        return _replay_details(cached_data)
+
+    _check_groq_key()
+    # Throttling and an open circuit are reported before the stream starts
+    governor = groq_governor()
+    try:
+        governor.before_call()
+    except UpstreamUnavailable as e:
+        raise _unavailable_error(e)
+    return _SyncGovernedStream(governor, _stream_details(plant_name, cache, key))
+
+
+async def astream_plant_details(plant_name):
+    """Async version of stream_plant_details, returning an async iterator"""
+    plant_name = await sync_to_async(canonical_plant_name, thread_sensitive=False)(plant_name)
+    cache = get_details_cache()
+    key = details_cache_key(plant_name)
+    cached_data = await sync_to_async(get_stored_details)(key)
+    if cached_data is None and cache:
+        cached_data = await sync_to_async(cache.get, thread_sensitive=False)(key)
+    if cached_data is not None:
+        logger.info(f"Plant details cache hit: {key}")
+        return _areplay_details(cached_data)
+
+    _check_groq_key()
+    governor = groq_governor()
+    try:
+        await governor.abefore_call()
+    except UpstreamUnavailable as e:
+        raise _unavailable_error(e)
+    return _AsyncGovernedStream(governor, _astream_details(plant_name, cache, key))
@@ -0,0 +1,121 @@
+# main/shaping.py
+
+"""
+Response shaping for the app on slow mobile networks: compact
+identification bodies (top-K candidates, chosen fields) and HTTP caching
+headers for plant details, so an unchanged answer is revalidated with a
+304 instead of downloaded again.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from .services import ServiceError
+from .streaming import request_flag
+
+
+def _option(request, data, name):
+    value = data.get(name)
+    return value if value not in (None, "") else request.GET.get(name)
+
+
+def requested_fields(request, data):
+    """Top-level fields asked for with fields=a,b (body or query string), or None for all"""
+    fields = _option(request, data, "fields")
+    return [field.strip() for field in str(fields).split(",") if field.strip()] if fields else None
+
+
+def shape_options(request, data):
+    """
+    compact, top_k and fields from the request body or query string, as
+    keyword arguments for shape_identification. Raises ServiceError (400)
+    for a top_k that isn't a positive number.
+    """
+    compact = request_flag(request, data, "compact")
+    top_k = _option(request, data, "top_k")
+    if top_k is not None:
+        try:
+            top_k = int(top_k)
+        except (TypeError, ValueError):
+            top_k = 0
+        if top_k < 1:
+            raise ServiceError({"error": "top_k must be a positive number"}, 400)
+    elif compact:
+        top_k = settings.COMPACT_TOP_K
+    return {"compact": compact, "top_k": top_k, "fields": requested_fields(request, data)}
+
+
+def shape_identification(body, compact=False, top_k=None, fields=None):
+    """
+    Copy of an identification body trimmed for the client; the (possibly
+    cached) body passed in is left alone. top_k keeps the best k
+    candidates. compact also drops results.best_match (the same as
+    best_match_scientific_name), keeps one common name per candidate and
+    leaves out purchase_links unless they are asked for in fields. fields
+    keeps only those top-level keys.
+    """
+    if not (compact or top_k or fields):
+        return body
+    shaped = dict(body)
+    results = body.get("results")
+    if isinstance(results, dict):
+        results = dict(results)
+        candidates = results.get("results") or []
+        if top_k:
+            candidates = candidates[:top_k]
+        if compact:
+            results.pop("best_match", None)
+            candidates = [
+                {**candidate, "common_names": (candidate.get("common_names") or [])[:1]}
+                for candidate in candidates
+            ]
+        results["results"] = candidates
+        shaped["results"] = results
+    if compact and not (fields and "purchase_links" in fields):
+        shaped.pop("purchase_links", None)
+    if fields:
+        shaped = {key: value for key, value in shaped.items() if key in fields}
+    return shaped
+
+
+def shape_events(events, options):
+    """(Async) describe_events output with the identification event shaped"""
+
+    def shape(event, data):
+        return data if event != "identification" else shape_identification(data, **options)
+
+    if hasattr(events, "__aiter__"):
+        async def shaped():
+            async for event, data in events:
+                yield event, shape(event, data)
+        return shaped()
+    return ((event, shape(event, data)) for event, data in events)
+
+
+def shape_details(details, fields=None):
+    if not fields:
+        return details
+    return {key: value for key, value in details.items() if key in fields}
+
+
+def details_etag(details):
+    """Strong ETag for a plant-details body"""
+    payload = json.dumps(details, sort_keys=True, separators=(",", ":"))
+    return quote_etag(hashlib.sha256(payload.encode()).hexdigest()[:32])
+
+
+def not_modified(request, etag):
+    """304 response when a GET's If-None-Match already has this ETag, else None"""
+    if request.method not in ("GET", "HEAD"):
+        return None
+    return get_conditional_response(request, etag=etag)
+
+
+def add_details_cache_headers(response, etag):
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=settings.DETAILS_HTTP_MAX_AGE)
+    return response
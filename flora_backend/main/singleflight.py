@@ -0,0 +1,56 @@
+# main/singleflight.py
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from .aio import LoopLocal
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, everyone arriving while it runs waits for and shares its result
+    (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on the same event loop"""
+
+    def __init__(self):
+        self._calls = LoopLocal(dict)
+
+    async def do(self, key, fn, *args, **kwargs):
+        calls = self._calls.get()
+        task = calls.get(key)
+        if task is None:
+            task = calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        # A waiter being cancelled must not cancel the call the others share
+        return await asyncio.shield(task)
@@ -0,0 +1,202 @@
+# main/species.py
+
+"""
+Species name index: scientific names, common names and synonyms from a
+tab-separated source file (main/data/species.tsv by default), compiled into
+a read-only SQLite file with an FTS5 table for autocomplete. Lookups read it
+through mmap, so every worker process on the host shares the same pages.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Which kind of name matched, best first
+SCIENTIFIC, SYNONYM, COMMON = 0, 1, 2
+KIND_NAMES = {SCIENTIFIC: "scientific", SYNONYM: "synonym", COMMON: "common"}
+
+
+def normalize_name(name):
+    """Case-, accent- and whitespace-insensitive form of a plant name"""
+    name = unicodedata.normalize("NFKD", name.replace("×", "x"))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(name.split()).casefold()
+
+
+def read_source(path):
+    """(scientific_name, common_names, synonyms) rows from a species TSV file"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            columns = line.rstrip("\n").split("\t") + ["", ""]
+            scientific_name = " ".join(columns[0].split())
+            common_names = [n.strip() for n in columns[1].split(";") if n.strip()]
+            synonyms = [n.strip() for n in columns[2].split(";") if n.strip()]
+            if scientific_name:
+                yield scientific_name, common_names, synonyms
+
+
+def build_index(source, path):
+    """
+    Compile the source file into a SQLite index at path. The file is built
+    next to it and moved into place, so readers never see a partial index.
+    Returns the number of species.
+    """
+    path = str(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(
+            "CREATE TABLE species ("
+            "id INTEGER PRIMARY KEY, scientific_name TEXT NOT NULL, common_names TEXT NOT NULL);"
+            "CREATE TABLE names (name TEXT NOT NULL, kind INTEGER NOT NULL, species_id INTEGER NOT NULL);"
+            "CREATE VIRTUAL TABLE names_fts USING fts5("
+            "name, kind UNINDEXED, species_id UNINDEXED, "
+            "prefix='2 3', tokenize='unicode61 remove_diacritics 2');"
+        )
+        count = 0
+        for species_id, (scientific_name, common_names, synonyms) in enumerate(read_source(source), 1):
+            conn.execute(
+                "INSERT INTO species (id, scientific_name, common_names) VALUES (?, ?, ?)",
+                (species_id, scientific_name, json.dumps(common_names)),
+            )
+            names = [(scientific_name, SCIENTIFIC)]
+            names += [(synonym, SYNONYM) for synonym in synonyms]
+            names += [(common_name, COMMON) for common_name in common_names]
+            conn.executemany(
+                "INSERT INTO names (name, kind, species_id) VALUES (?, ?, ?)",
+                [(normalize_name(name), kind, species_id) for name, kind in names],
+            )
+            conn.executemany(
+                "INSERT INTO names_fts (name, kind, species_id) VALUES (?, ?, ?)",
+                [(name, kind, species_id) for name, kind in names],
+            )
+            count = species_id
+        # species_id in the key keeps earlier source rows first for shared names
+        conn.execute("CREATE INDEX names_name ON names (name, kind, species_id)")
+        conn.execute("INSERT INTO names_fts (names_fts) VALUES ('optimize')")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    logger.info(f"Built species index {path} with {count} species")
+    return count
+
+
+class SpeciesIndex:
+    """Read-only lookups in a compiled species index"""
+
+    def __init__(self, path, mmap_size=64 * 1024 * 1024):
+        self.path = str(path)
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+        return conn
+
+    def _species(self, conn, species_id):
+        scientific_name, common_names = conn.execute(
+            "SELECT scientific_name, common_names FROM species WHERE id = ?", (species_id,)
+        ).fetchone()
+        return {"scientific_name": scientific_name, "common_names": json.loads(common_names)}
+
+    def resolve(self, name):
+        """
+        The species a name refers to, or None. Scientific names win over
+        synonyms, synonyms over common names, then earlier rows of the source.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT species_id, kind FROM names WHERE name = ? ORDER BY kind, species_id LIMIT 1",
+            (normalize_name(name),),
+        ).fetchone()
+        if row is None:
+            return None
+        return {**self._species(conn, row[0]), "match": KIND_NAMES[row[1]]}
+
+    def search(self, query, limit=10):
+        """Species with a name containing words that start with the words of query, best first"""
+        normalized = normalize_name(query)
+        words = normalized.split()
+        if not words:
+            return []
+        fts_query = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT name, kind, species_id FROM names_fts WHERE names_fts MATCH ? "
+                "ORDER BY rank LIMIT ?",
+                (fts_query, limit * 5),
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Species search failed for {query!r}: {str(e)}")
+            return []
+
+        def order(row):
+            name = normalize_name(row[0])
+            return (name != normalized, not name.startswith(normalized), row[1])
+
+        results = []
+        seen = set()
+        for name, kind, species_id in sorted(rows, key=order):
+            if species_id in seen:
+                continue
+            seen.add(species_id)
+            results.append({
+                **self._species(conn, species_id),
+                "matched_name": name,
+                "match": KIND_NAMES[kind],
+            })
+            if len(results) >= limit:
+                break
+        return results
+
+
+def _index_is_stale(source, path):
+    if not os.path.exists(path):
+        return True
+    return os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_species_index():
+    """
+    Process-wide SpeciesIndex, compiling SPECIES_INDEX_SOURCE first when the
+    index is missing or older than it. None when the index is disabled or
+    can't be built.
+    """
+    global _index
+    if not settings.SPECIES_INDEX:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                source, path = str(settings.SPECIES_INDEX_SOURCE), str(settings.SPECIES_INDEX_PATH)
+                try:
+                    if _index_is_stale(source, path):
+                        build_index(source, path)
+                except (OSError, sqlite3.Error) as e:
+                    logger.error(f"Could not build species index: {str(e)}")
+                    if not os.path.exists(path):
+                        return None
+                _index = SpeciesIndex(path)
+    return _index
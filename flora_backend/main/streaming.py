@@ -0,0 +1,127 @@
+# main/streaming.py
+
+import json
+import logging
+
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ("1", "true", "yes")
+
+
+class SectionParser:
+    """
+    Incrementally scans a streamed JSON object and returns each top-level
+    member (e.g. 'introduction', 'facts') as soon as its value is complete.
+    Anything before the opening brace, like a Markdown fence, is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        members = []
+        for i in range(self._pos, len(self.buffer)):
+            ch = self.buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1 and ch == "{":
+                    self._member_start = i + 1
+            elif ch in "}]":
+                if self._depth == 1:
+                    members.extend(self._complete_member(i))
+                self._depth -= 1
+            elif ch == "," and self._depth == 1:
+                members.extend(self._complete_member(i))
+                self._member_start = i + 1
+        self._pos = len(self.buffer)
+        return members
+
+    def _complete_member(self, end):
+        if self._member_start is None:
+            return []
+        text = self.buffer[self._member_start:end].strip()
+        if not text:
+            return []
+        try:
+            return list(json.loads("{" + text + "}").items())
+        except ValueError:
+            return []
+
+
+def json_object_text(text):
+    """The outermost {...} in a model answer, dropping fences or chatter around it"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return text
+    return text[start:end + 1]
+
+
+def request_flag(request, data, name):
+    """Boolean option from the request body or query string"""
+    value = data.get(name) or request.GET.get(name)
+    return value is not None and str(value).lower() in TRUE_VALUES
+
+
+def wants_stream(request, data):
+    """Streaming is requested with stream=true (body or query) or Accept: text/event-stream"""
+    if request_flag(request, data, "stream"):
+        return True
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _error_payload(e):
+    payload = getattr(e, "payload", None)
+    if payload is None:
+        logger.error(f"Error streaming plant details: {str(e)}", exc_info=True)
+        payload = {"error": f"Failed to get plant details: {str(e)}"}
+    return payload
+
+
+def _sse_stream(events):
+    try:
+        for event, data in events:
+            yield sse_event(event, data)
+    except Exception as e:
+        # Headers are already sent, so failures are reported in-band
+        yield sse_event("error", _error_payload(e))
+
+
+async def _async_sse_stream(events):
+    try:
+        async for event, data in events:
+            yield sse_event(event, data)
+    except Exception as e:
+        yield sse_event("error", _error_payload(e))
+
+
+def sse_response(events):
+    """Server-sent events response for a (sync or async) iterator of (event, data) pairs"""
+    if hasattr(events, "__aiter__"):
+        stream = _async_sse_stream(events)
+    else:
+        stream = _sse_stream(events)
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Stop nginx from buffering the stream
+    return response
@@ -1,3 +1,673 @@
-from django.test import TestCase
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+from asgiref.sync import async_to_sync
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from benchmarks.stubs import PlantNetHandler, StubServer
+
+from .cache import IdentificationCache, LocMemBackend, SQLiteBackend
+from .jobs import JobWorker, callback_url_allowed, claim_jobs, requeue_stale_jobs, run_job
+from .middleware import CompressionMiddleware
+from .models import IdentifiedPlant
+from .plantnet import AsyncPlantNetClient, PlantNetClient, PlantNetError
+from .preprocessing import prepare_image_part
+from .ratelimit import CircuitBreaker, SharedTokenBucket, TokenBucket, UpstreamGovernor
+from .services import (
+    ServiceError, _plantnet_error, astream_plant_details, is_low_confidence, select_candidates,
+    stream_plant_details,
+)
+from .shaping import shape_identification
+from .streaming import SectionParser, json_object_text
+from .uploads import limit_request_body
+
+
+class CacheBackendTests(TestCase):
+    def setUp(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir, ignore_errors=True)
+        self.path = os.path.join(state_dir, "cache.sqlite3")
+
+    def backends(self):
+        return [LocMemBackend(max_entries=2), SQLiteBackend(self.path, max_entries=2)]
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for backend in self.backends():
+            with self.subTest(backend=type(backend).__name__):
+                backend.set("a", "1")
+                backend.set("b", "2")
+                backend.get("a")
+                backend.set("c", "3")
+                self.assertEqual(backend.get("a"), "1")
+                self.assertIsNone(backend.get("b"))
+                self.assertEqual(backend.get("c"), "3")
+                self.assertEqual(len(backend), 2)
+
+    def test_entries_expire_after_ttl(self):
+        for backend in self.backends():
+            with self.subTest(backend=type(backend).__name__):
+                backend.set("short", "1", ttl=0.01)
+                backend.set("long", "2", ttl=60)
+                time.sleep(0.02)
+                self.assertIsNone(backend.get("short"))
+                self.assertEqual(backend.get("long"), "2")
+
+
+
+
+class PerceptualCacheTests(TestCase):
+    def setUp(self):
+        self.cache = IdentificationCache(LocMemBackend(), use_perceptual_hash=True)
+
+    def photo(self, pixels, size=(9, 8), scale=10):
+        image = Image.new("L", size)
+        image.putdata(pixels)
+        buffer = io.BytesIO()
+        image.resize((size[0] * scale, size[1] * scale), Image.NEAREST).save(buffer, "PNG")
+        return SimpleUploadedFile("plant.png", buffer.getvalue(), content_type="image/png")
+
+    def textured(self, offset=0):
+        """Rows of random ups and downs, so every neighbour pair differs"""
+        rng = random.Random(1)
+        pixels = []
+        for _ in range(8):
+            value = 60
+            for _ in range(9):
+                pixels.append(value + offset)
+                step = rng.choice((-20, 20))
+                if not 20 <= value + step <= 100:
+                    step = -step
+                value += step
+        return pixels
+
+    def remember(self, uploaded_file, name):
+        self.cache.store(self.cache.keys_for(uploaded_file), {"best_match": name})
+
+    def test_resized_copy_is_a_hit(self):
+        self.remember(self.photo(self.textured()), "Bellis perennis")
+        copy = self.photo(self.textured(), scale=23)
+        self.assertEqual(self.cache.lookup(self.cache.keys_for(copy)), {"best_match": "Bellis perennis"})
+
+    def test_flat_photos_only_match_exactly(self):
+        black, white = self.photo([0] * 72), self.photo([255] * 72)
+        self.assertEqual(len(self.cache.keys_for(black)), 1)
+        self.remember(black, "Black")
+        self.assertIsNone(self.cache.lookup(self.cache.keys_for(white)))
+
+    def test_same_dhash_with_different_brightness_is_a_miss(self):
+        original = self.photo(self.textured())
+        self.remember(original, "Bellis perennis")
+        brighter = self.photo(self.textured(offset=120))
+        self.assertEqual(str(self.cache.keys_for(brighter)[1]), str(self.cache.keys_for(original)[1]))
+        self.assertIsNone(self.cache.lookup(self.cache.keys_for(brighter)))
+
+class PlantNetClientTests(TestCase):
+    """Retries and timeouts against the benchmark's PlantNet stub"""
+
+    def start_stub(self, **options):
+        server = StubServer(("127.0.0.1", 0), PlantNetHandler, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f"http://127.0.0.1:{server.server_port}"
+
+    def identify(self, client_class, base_url, **options):
+        options = {"max_retries": 1, "backoff_factor": 0, "max_backoff": 0.1, "read_timeout": 0.5, **options}
+        client = client_class("test-key", base_url=base_url, **options)
+        image = ("plant.jpg", b"image", "image/jpeg")
+        if client_class is AsyncPlantNetClient:
+            async def identify():
+                try:
+                    return await client.identify([image])
+                finally:
+                    await client.aclose()
+            return async_to_sync(identify)()
+        return client.identify([image])
+
+    def test_retry_after_is_capped(self):
+        for client_class in (PlantNetClient, AsyncPlantNetClient):
+            with self.subTest(client=client_class.__name__):
+                server, base_url = self.start_stub(error_rate=1.0, error_status=503, retry_after=3600)
+                started = time.monotonic()
+                with self.assertRaises(PlantNetError) as raised:
+                    self.identify(client_class, base_url)
+                self.assertEqual(raised.exception.status_code, 503)
+                self.assertEqual(server.calls, 2)
+                self.assertLess(time.monotonic() - started, 2)
+
+    def test_answer_is_returned(self):
+        for client_class in (PlantNetClient, AsyncPlantNetClient):
+            with self.subTest(client=client_class.__name__):
+                _, base_url = self.start_stub()
+                self.assertIn("bestMatch", self.identify(client_class, base_url))
+
+    def test_read_timeout_is_not_retried(self):
+        for client_class, timeout_error in ((PlantNetClient, requests.exceptions.RequestException),
+                                            (AsyncPlantNetClient, httpx.ReadTimeout)):
+            with self.subTest(client=client_class.__name__):
+                server, base_url = self.start_stub(latency=0.5)
+                with self.assertRaises(timeout_error):
+                    self.identify(client_class, base_url, read_timeout=0.1)
+                self.assertEqual(server.calls, 1)
+
+class PreprocessMetricsTests(TestCase):
+    def test_sizes_before_and_after_are_recorded(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "green").save(buffer, format="PNG")
+        upload = SimpleUploadedFile("plant.png", buffer.getvalue(), content_type="image/png")
+        with mock.patch("main.preprocessing.metrics.observe_payload") as observe_payload:
+            prepare_image_part(upload)
+        sizes = {call.args[0]: call.args[1] for call in observe_payload.call_args_list}
+        self.assertEqual(sizes["preprocess_original"], upload.size)
+        self.assertGreater(sizes["preprocess_resized"], 0)
+
+
+@override_settings(IDENTIFY_JOBS_IN_PROCESS=False)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def image(self):
+        return SimpleUploadedFile("plant.jpg", b"image", content_type="image/jpeg")
+
+    def test_refused_under_wsgi(self):
+        response = self.client.get("/api/async/plant-details/", {"plant_name": "Bellis perennis"})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("ASGI", response.json()["error"])
+
+    async def test_queue_returns_a_pending_job(self):
+        with mock.patch("main.async_views.aidentify_upload") as identify:
+            response = await self.async_client.post("/api/async/identify/", {"image": self.image(), "queue": "true"})
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(identify.called)
+        plant = await IdentifiedPlant.objects.aget(id=response.json()["id"])
+        self.assertEqual(plant.status, IdentifiedPlant.STATUS_PENDING)
+
+    async def test_internal_callback_url_is_rejected(self):
+        response = await self.async_client.post(
+            "/api/async/identify/",
+            {"image": self.image(), "queue": "true", "callback_url": "http://127.0.0.1/hook"},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await IdentifiedPlant.objects.aexists())
+
+
+class SectionParserTests(TestCase):
+    def test_members_are_returned_once_complete(self):
+        parser = SectionParser()
+        self.assertEqual(parser.feed('```json\n{"introduction": "Hi, '), [])
+        self.assertEqual(parser.feed('there", "facts": {"uses": [1,'), [("introduction", "Hi, there")])
+        self.assertEqual(parser.feed(' 2]}}\n```'), [("facts", {"uses": [1, 2]})])
+
+    def test_escaped_quotes_stay_inside_strings(self):
+        parser = SectionParser()
+        self.assertEqual(parser.feed('{"name": "a \\"b, c\\"", "x": 1}'), [("name", 'a "b, c"'), ("x", 1)])
+
+    def test_json_object_text(self):
+        self.assertEqual(json_object_text('Sure!\n```json\n{"a": {"b": 1}}\n```'), '{"a": {"b": 1}}')
+        self.assertEqual(json_object_text("no object"), "no object")
+
+
+@override_settings(IDENTIFY_PERSIST=False)
+class BatchIdentifyTests(TestCase):
+    identification = {"best_match_scientific_name": "Bellis perennis", "results": {"results": []}}
+
+    def image(self, content):
+        return SimpleUploadedFile("plant.jpg", content, content_type="image/jpeg")
+
+    def post_batch(self, data, **identify):
+        identify.setdefault("return_value", (self.identification, None))
+        with mock.patch("main.batch.identify_images", **identify) as identify_images:
+            response = self.client.post("/api/identify/batch/", data)
+        return response, identify_images
+
+    def test_identical_images_are_identified_once(self):
+        response, identify_images = self.post_batch(
+            {"images": [self.image(b"a"), self.image(b"a"), self.image(b"b")]}
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([item["id"] for item in results], ["images[0]", "images[1]", "images[2]"])
+        self.assertEqual(results[1]["duplicate_of"], "images[0]")
+        self.assertEqual(results[1]["result"], self.identification)
+        self.assertEqual(identify_images.call_count, 2)
+
+    def test_multi_organ_set_is_identified_together(self):
+        response, identify_images = self.post_batch(
+            {"plant_rose": [self.image(b"a"), self.image(b"b")], "organs_rose": ["leaf", "flower"]}
+        )
+        self.assertEqual(response.json()["results"][0]["status"], 200)
+        images, organs = identify_images.call_args.args
+        self.assertEqual(len(images), 2)
+        self.assertEqual(organs, ["leaf", "flower"])
+
+    def test_errors_are_reported_per_item(self):
+        response, _ = self.post_batch(
+            {"images": [self.image(b"a")], "plant_rose": [self.image(b"b"), self.image(b"c")],
+             "organs_rose": ["leaf"]},
+            side_effect=ServiceError({"error": "No plant matches found"}, 404),
+        )
+        results = {item["id"]: item for item in response.json()["results"]}
+        self.assertEqual(results["images[0]"]["status"], 404)
+        self.assertEqual(results["plant_rose"]["status"], 400)
+
+    def test_empty_batch_is_rejected(self):
+        self.assertEqual(self.client.post("/api/identify/batch/", {}).status_code, 400)
+
+
+@override_settings(IDENTIFY_PERSIST=True, IDENTIFY_PERSIST_ASYNC=True, THUMBNAIL_SIZE=0)
+class BatchPersistTests(TransactionTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def test_items_report_their_stored_row(self):
+        images = [SimpleUploadedFile(f"{name}.jpg", name.encode(), content_type="image/jpeg")
+                  for name in ("leaf", "flower", "single")]
+        identification = {"best_match_scientific_name": "Bellis perennis", "results": {"results": []}}
+        with mock.patch("main.batch.identify_images", return_value=(identification, None)):
+            response = self.client.post("/api/identify/batch/", {"plant_rose": images[:2], "images": images[2:]})
+        results = {item["id"]: item for item in response.json()["results"]}
+        for item_id, content in (("plant_rose", b"leaf"), ("images[0]", b"single")):
+            plant = IdentifiedPlant.objects.get(id=results[item_id]["plant_id"])
+            with plant.image.open("rb") as image_file:
+                self.assertEqual(image_file.read(), content)
+
+
+class JobTestCase(TestCase):
+    """Jobs store their upload, so give each test its own MEDIA_ROOT"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def make_job(self, **fields):
+        fields.setdefault("status", IdentifiedPlant.STATUS_RUNNING)
+        return IdentifiedPlant.objects.create(image=ContentFile(b"image", name="plant.jpg"), **fields)
+
+
+class JobQueueTests(JobTestCase):
+    def test_oldest_pending_jobs_are_claimed_once(self):
+        jobs = [self.make_job(status=IdentifiedPlant.STATUS_PENDING) for _ in range(3)]
+        self.make_job(status=IdentifiedPlant.STATUS_DONE)
+        self.assertEqual(claim_jobs(2), [jobs[0].id, jobs[1].id])
+        self.assertEqual(claim_jobs(2), [jobs[2].id])
+        self.assertEqual(claim_jobs(2), [])
+        running = IdentifiedPlant.objects.filter(status=IdentifiedPlant.STATUS_RUNNING)
+        self.assertEqual(running.count(), 3)
+        self.assertFalse(running.filter(started_at__isnull=True).exists())
+
+    def test_stale_running_jobs_are_requeued(self):
+        timeout = timedelta(seconds=settings.IDENTIFY_JOB_TIMEOUT + 1)
+        stale = self.make_job(started_at=timezone.now() - timeout)
+        fresh = self.make_job(started_at=timezone.now())
+        self.assertEqual(requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, IdentifiedPlant.STATUS_PENDING)
+        self.assertEqual(fresh.status, IdentifiedPlant.STATUS_RUNNING)
+
+    def test_jobs_are_not_claimed_before_not_before(self):
+        waiting = self.make_job(status=IdentifiedPlant.STATUS_PENDING,
+                                not_before=timezone.now() + timedelta(minutes=1))
+        due = self.make_job(status=IdentifiedPlant.STATUS_PENDING,
+                            not_before=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_jobs(2), [due.id])
+        IdentifiedPlant.objects.filter(id=waiting.id).update(not_before=timezone.now())
+        self.assertEqual(claim_jobs(2), [waiting.id])
+
+    def test_worker_requeues_stale_jobs_while_running(self):
+        worker = JobWorker(poll_interval=0, requeue_interval=0)
+        polls = []
+
+        def run_once():
+            polls.append(1)
+            if len(polls) == 3:
+                worker.stop()
+
+        with mock.patch("main.jobs.requeue_stale_jobs") as requeue, \
+                mock.patch.object(worker, "run_once", side_effect=run_once):
+            worker.run_forever()
+        self.assertEqual(requeue.call_count, 3)
+
+
+class PlantNetErrorTests(TestCase):
+    def test_client_errors_stay_400(self):
+        self.assertEqual(_plantnet_error(PlantNetError("Species not found", 404)).status_code, 400)
+
+    def test_upstream_failures_are_gateway_errors(self):
+        self.assertEqual(_plantnet_error(PlantNetError("Too many requests", 429)).status_code, 503)
+        self.assertEqual(_plantnet_error(PlantNetError("Bad gateway", 502)).status_code, 502)
+        self.assertEqual(_plantnet_error(PlantNetError("Internal error", 500)).status_code, 502)
+
+
+@override_settings(IDENTIFY_JOB_MAX_ATTEMPTS=2)
+class RunJobRetryTests(JobTestCase):
+    def run_failing(self, job, upstream_status):
+        error = _plantnet_error(PlantNetError("PlantNet said no", upstream_status))
+        with mock.patch("main.jobs.identify_images", side_effect=error):
+            return run_job(job.id)
+
+    @override_settings(IDENTIFY_JOB_RETRY_BACKOFF=10)
+    def test_upstream_outage_is_retried_after_a_backoff(self):
+        job = self.run_failing(self.make_job(), 503)
+        self.assertEqual(job.status, IdentifiedPlant.STATUS_PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.not_before, timezone.now() + timedelta(seconds=5))
+
+    def test_throttled_job_waits_for_retry_after(self):
+        error = ServiceError({"error": "Too many requests", "retry_after": 30}, 429)
+        with mock.patch("main.jobs.identify_images", side_effect=error):
+            job = run_job(self.make_job().id)
+        self.assertEqual(job.status, IdentifiedPlant.STATUS_PENDING)
+        self.assertEqual(job.attempts, 0)
+        self.assertGreater(job.not_before, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_upstream_outage_fails_after_max_attempts(self):
+        job = self.run_failing(self.make_job(attempts=1), 503)
+        self.assertEqual(job.status, IdentifiedPlant.STATUS_FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_rejected_image_is_not_retried(self):
+        job = self.run_failing(self.make_job(), 404)
+        self.assertEqual(job.status, IdentifiedPlant.STATUS_FAILED)
+        self.assertEqual(job.error["error"], "Bad Request to PlantNet API")
+
+
+class CallbackUrlTests(TestCase):
+    def test_internal_addresses_are_rejected(self):
+        for url in ("http://127.0.0.1/hook", "http://localhost:8000/hook", "http://169.254.169.254/latest",
+                    "http://10.0.0.5/hook", "http://[::1]/hook", "ftp://example.com/hook"):
+            self.assertFalse(callback_url_allowed(url), url)
+
+    def test_public_address_is_accepted(self):
+        self.assertTrue(callback_url_allowed("https://93.184.215.14/hook"))
+
+    @override_settings(IDENTIFY_JOB_CALLBACK_HOSTS=["hooks.internal"])
+    def test_allowlist_replaces_address_check(self):
+        self.assertTrue(callback_url_allowed("http://hooks.internal/done"))
+        self.assertFalse(callback_url_allowed("https://93.184.215.14/hook"))
+
+
+class TokenBucketTests(TestCase):
+    def test_bucket_empties_then_asks_to_wait(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertGreater(bucket.try_acquire(), 0)
+        self.assertFalse(bucket.acquire(timeout=0.1))
+
+    def test_zero_rate_is_unlimited(self):
+        bucket = TokenBucket(rate=0)
+        self.assertTrue(all(bucket.try_acquire() == 0 for _ in range(100)))
+
+    def test_shared_bucket_is_shared_between_instances(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir, ignore_errors=True)
+        path = os.path.join(state_dir, "ratelimit.sqlite3")
+        first = SharedTokenBucket(path, "plantnet", rate=1, capacity=2)
+        second = SharedTokenBucket(path, "plantnet", rate=1, capacity=2)
+        other = SharedTokenBucket(path, "groq", rate=1, capacity=2)
+        self.assertEqual(first.try_acquire(), 0)
+        self.assertEqual(second.try_acquire(), 0)
+        self.assertGreater(first.try_acquire(), 0)
+        self.assertEqual(other.try_acquire(), 0)
+
+
+class CircuitBreakerTests(TestCase):
+    def open_breaker(self):
+        breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        return breaker
+
+    def elapse_reset_timeout(self, breaker):
+        breaker._opened_at -= breaker.reset_timeout
+
+    def test_opens_after_threshold_failures(self):
+        breaker = self.open_breaker()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 0)
+
+    def test_success_resets_the_failure_count(self):
+        breaker = CircuitBreaker(threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        self.assertFalse(breaker.record_failure())
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = self.open_breaker()
+        self.elapse_reset_timeout(breaker)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_opens_again(self):
+        breaker = self.open_breaker()
+        self.elapse_reset_timeout(breaker)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_cancelled_trial_lets_another_through(self):
+        breaker = self.open_breaker()
+        self.elapse_reset_timeout(breaker)
+        self.assertTrue(breaker.allow())
+        breaker.cancel()
+        self.assertTrue(breaker.allow())
+
+
+
+@override_settings(GROQ_API_KEY="test-key")
+class DetailsStreamBreakerTests(TestCase):
+    """A streamed details call holds the half-open trial only once it is iterated"""
+
+    def setUp(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        breaker._opened_at -= breaker.reset_timeout
+        self.governor = UpstreamGovernor("groq", TokenBucket(rate=0), breaker)
+        patcher = mock.patch("main.services.groq_governor", return_value=self.governor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_closed_stream_gives_the_trial_back(self):
+        stream = stream_plant_details("Bellis perennis")
+        self.assertFalse(self.governor.breaker.allow())
+        stream.close()
+        self.assertTrue(self.governor.breaker.allow())
+
+    def test_dropped_stream_gives_the_trial_back(self):
+        stream_plant_details("Bellis perennis")
+        self.assertTrue(self.governor.breaker.allow())
+
+    def test_closed_async_stream_gives_the_trial_back(self):
+        stream = async_to_sync(astream_plant_details)("Bellis perennis")
+        self.assertFalse(self.governor.breaker.allow())
+        async_to_sync(stream.aclose)()
+        self.assertTrue(self.governor.breaker.allow())
+
+@override_settings(UPLOAD_MAX_REQUEST_SIZE=4096, UPLOAD_MAX_FILE_SIZE=1024)
+class UploadLimitTests(TestCase):
+    def identify(self, size):
+        return self.client.post("/api/identify/", {"image": SimpleUploadedFile("plant.jpg", b"x" * size)})
+
+    def test_oversized_file_gets_413(self):
+        response = self.identify(2048)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()["max_bytes"], 1024)
+
+    def test_oversized_request_gets_413(self):
+        response = self.identify(8192)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()["max_bytes"], 4096)
+
+
+class AsgiBodyLimitTests(TestCase):
+    def call(self, headers, chunks, max_size=10):
+        """Statuses sent and messages the wrapped application received"""
+        messages = [
+            {"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+            for index, chunk in enumerate(chunks)
+        ]
+        received, sent = [], []
+
+        async def application(scope, receive, send):
+            while True:
+                message = await receive()
+                received.append(message["type"])
+                if message["type"] != "http.request" or not message["more_body"]:
+                    break
+            if message["type"] == "http.request":
+                await send({"type": "http.response.start", "status": 200, "headers": []})
+                await send({"type": "http.response.body", "body": b"ok"})
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        limited = limit_request_body(application, max_size=max_size)
+        async_to_sync(limited)({"type": "http", "headers": headers}, receive, send)
+        return [message["status"] for message in sent if message["type"] == "http.response.start"], received
+
+    def test_declared_length_over_limit_is_rejected_unread(self):
+        statuses, received = self.call([(b"content-length", b"11")], [b"x" * 11])
+        self.assertEqual(statuses, [413])
+        self.assertEqual(received, [])
+
+    def test_streamed_body_over_limit_is_cut_off(self):
+        statuses, received = self.call([], [b"x" * 6, b"x" * 6])
+        self.assertEqual(statuses, [413])
+        self.assertEqual(received, ["http.request", "http.disconnect"])
+
+    def test_body_within_limit_is_passed_on(self):
+        statuses, received = self.call([(b"content-length", b"10")], [b"x" * 4, b"x" * 6])
+        self.assertEqual(statuses, [200])
+        self.assertEqual(received, ["http.request", "http.request"])
+
+
+class ShapeIdentificationTests(TestCase):
+    body = {
+        "best_match_scientific_name": "Bellis perennis",
+        "results": {
+            "best_match": "Bellis perennis",
+            "results": [
+                {"scientific_name": "Bellis perennis", "common_names": ["Daisy", "Lawn daisy"], "score": 0.9},
+                {"scientific_name": "Leucanthemum vulgare", "common_names": ["Oxeye daisy"], "score": 0.05},
+            ],
+        },
+        "purchase_links": {"amazon": "https://example.com"},
+    }
+
+    def test_no_options_returns_body_unchanged(self):
+        self.assertIs(shape_identification(self.body), self.body)
+
+    def test_compact(self):
+        shaped = shape_identification(self.body, compact=True, top_k=1)
+        self.assertNotIn("purchase_links", shaped)
+        self.assertNotIn("best_match", shaped["results"])
+        self.assertEqual(shaped["results"]["results"], [
+            {"scientific_name": "Bellis perennis", "common_names": ["Daisy"], "score": 0.9},
+        ])
+        self.assertEqual(len(self.body["results"]["results"]), 2)
+
+    def test_fields(self):
+        shaped = shape_identification(self.body, fields=["best_match_scientific_name"])
+        self.assertEqual(shaped, {"best_match_scientific_name": "Bellis perennis"})
+
+
+class PlantDetailsHttpCacheTests(TestCase):
+    details = {"introduction": "A small daisy.", "care": "Full sun."}
+
+    def get_details(self, **headers):
+        with mock.patch("main.views.get_plant_details", return_value=(self.details, "HIT")):
+            return self.client.get("/api/plant-details/", {"plant_name": "Bellis perennis"}, **headers)
+
+    def test_etag_and_not_modified(self):
+        response = self.get_details()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age", response["Cache-Control"])
+        etag = response["ETag"]
+        response = self.get_details(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_changed_details_get_a_new_body(self):
+        response = self.get_details(HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.details)
+
+
+@override_settings(RESPONSE_COMPRESSION=True, RESPONSE_COMPRESSION_MIN_SIZE=10)
+class CompressionMiddlewareTests(TestCase):
+    def compress(self, response):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_json_is_compressed(self):
+        response = self.compress(JsonResponse({"results": ["Bellis perennis"] * 50}))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_html_is_not_compressed(self):
+        response = self.compress(HttpResponse("<input name='csrfmiddlewaretoken'>" * 50))
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class CandidateFilterTests(TestCase):
+    results = [{"score": 0.6}, {"score": 0.3}, {"score": 0.05}, {"score": 0.2}]
+
+    @override_settings(IDENTIFY_MIN_SCORE=0, IDENTIFY_TOP_K=0)
+    def test_defaults_keep_everything(self):
+        self.assertEqual(select_candidates(self.results), self.results)
+
+    @override_settings(IDENTIFY_MIN_SCORE=0.1, IDENTIFY_TOP_K=2)
+    def test_min_score_then_top_k(self):
+        self.assertEqual(select_candidates(self.results), [{"score": 0.6}, {"score": 0.3}])
+
+    @override_settings(IDENTIFY_MIN_SCORE=0.9, IDENTIFY_TOP_K=0)
+    def test_best_candidate_is_always_kept(self):
+        self.assertEqual(select_candidates(self.results), [{"score": 0.6}])
+
+    @override_settings(IDENTIFY_LOW_CONFIDENCE_SCORE=0.5)
+    def test_low_confidence(self):
+        self.assertFalse(is_low_confidence({"results": [{"score": 0.6}]}))
+        self.assertTrue(is_low_confidence({"results": [{"score": 0.4}]}))
+        self.assertFalse(is_low_confidence({"results": []}))
+
+    @override_settings(IDENTIFY_LOW_CONFIDENCE_SCORE=0)
+    def test_low_confidence_disabled(self):
+        self.assertFalse(is_low_confidence({"results": [{"score": 0.01}]}))
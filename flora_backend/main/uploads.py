@@ -0,0 +1,141 @@
+# main/uploads.py
+
+"""
+Upload size limits. Oversized requests are turned away with 413 before
+their body is read: by Content-Length in UploadLimitMiddleware, and under
+ASGI (where Django buffers the whole body before any middleware runs) by
+limit_request_body as the body streams in. LimitedUploadHandler caps each
+file while multipart bodies are parsed.
+"""
+
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http import JsonResponse
+from rest_framework import status
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit, what="Request body"):
+        super().__init__(f"{what} exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+def too_large_response(e):
+    return JsonResponse(
+        {"error": str(e), "max_bytes": e.limit},
+        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    )
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """
+    First in FILE_UPLOAD_HANDLERS: stops parsing as soon as the body or a
+    single file passes its limit, before the rest is spooled to memory or
+    disk. Passes every chunk on to the next handler unchanged.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > settings.UPLOAD_MAX_REQUEST_SIZE:
+            raise UploadTooLarge(settings.UPLOAD_MAX_REQUEST_SIZE)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_REQUEST_SIZE:
+            raise UploadTooLarge(settings.UPLOAD_MAX_REQUEST_SIZE)
+        if start + len(raw_data) > settings.UPLOAD_MAX_FILE_SIZE:
+            raise UploadTooLarge(settings.UPLOAD_MAX_FILE_SIZE, f"File {self.file_name!r}")
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class UploadLimitMiddleware:
+    """Rejects requests by Content-Length, and turns UploadTooLarge from parsing into 413"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _check(self, request):
+        content_length = request.META.get("CONTENT_LENGTH")
+        if content_length and content_length.isdigit() and int(content_length) > settings.UPLOAD_MAX_REQUEST_SIZE:
+            logger.warning(f"Rejected {content_length} byte request to {request.path}")
+            return too_large_response(UploadTooLarge(settings.UPLOAD_MAX_REQUEST_SIZE))
+        return None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self._check(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self._check(request) or await self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, UploadTooLarge):
+            logger.warning(f"Rejected upload to {request.path}: {str(exception)}")
+            return too_large_response(exception)
+        return None
+
+
+def limit_request_body(application, max_size=None):
+    """
+    Wrap an ASGI application so request bodies over max_size bytes
+    (UPLOAD_MAX_REQUEST_SIZE by default) get 413 as soon as the declared or
+    received length passes it, instead of being buffered first.
+    """
+    max_size = max_size or settings.UPLOAD_MAX_REQUEST_SIZE
+
+    async def send_413(send):
+        body = f'{{"error": "Request body exceeds the {max_size} byte limit", "max_bytes": {max_size}}}'.encode()
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def limited(scope, receive, send):
+        if scope["type"] != "http":
+            return await application(scope, receive, send)
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > max_size:
+            # Drained by the server, never read into this worker
+            return await send_413(send)
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_size:
+                    # Django treats the disconnect as an aborted request and sends nothing
+                    rejected = True
+                    await send_413(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        return await application(scope, limited_receive, send)
+
+    return limited
@@ -1,20 +1,44 @@
 # main/views.py
 
 import os
-import json
 import time
-import tempfile
-import requests
 import logging
-import shutil
-import urllib.parse  
 from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.urls import reverse
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from . import metrics
 from .models import IdentifiedPlant
-from .serializers import IdentifiedPlantSerializer
+from .serializers import IdentifiedPlantListSerializer, IdentifiedPlantSerializer
+from .pagination import IdentificationCursorPagination
+from .persistence import record_identification
+from .batch import identify_batch, parse_batch
+from .jobs import check_callback_url, enqueue_identification, job_payload
+from .cache import get_identification_cache
+from .species import get_species_index
+from .services import (
+    ServiceError,
+    get_plant_details,
+    identify_upload,
+    stream_plant_details,
+    upstream_stats,
+)
+from .pipeline import describe, describe_events
+from .shaping import (
+    add_details_cache_headers,
+    details_etag,
+    not_modified,
+    requested_fields,
+    shape_details,
+    shape_events,
+    shape_identification,
+    shape_options,
+)
+from .streaming import request_flag, sse_response, wants_stream
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -34,162 +58,49 @@ def safe_delete_file(file_path, max_attempts=3, delay=0.5):
 
 
 class IdentifyPlantView(viewsets.ModelViewSet):
+    """
+    Plant identification through PlantNet. Pass include_details=true to get
+    GROQ details for the top match in the same response, or pushed as a
+    server-sent "details" event after the identification when streaming.
+    Every identification is stored; list/retrieve browse that history.
+    With queue=true the upload is only queued: the response is 202 with a
+    status_url to poll, and the result can also be POSTed to callback_url.
+    """
     queryset = IdentifiedPlant.objects.all()
     serializer_class = IdentifiedPlantSerializer
+    pagination_class = IdentificationCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            # Only read the listed columns, not the results JSON
+            queryset = queryset.only(*IdentifiedPlantListSerializer.Meta.fields)
+            scientific_name = self.request.query_params.get("scientific_name")
+            if scientific_name:
+                queryset = queryset.filter(best_match_scientific_name=scientific_name)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return IdentifiedPlantListSerializer
+        return super().get_serializer_class()
 
     def create(self, request, *args, **kwargs):
-        uploaded_image = request.FILES.get("image")
+        with metrics.timed("upload_parse"):
+            uploaded_image = request.FILES.get("image")
         if not uploaded_image:
             return Response(
                 {"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Create a temporary file outside Django's media system
-        temp_dir = tempfile.mkdtemp()
-        temp_file_path = os.path.join(temp_dir, "temp_plant_image.jpg")
-        plant_instance = None # Initialize to None
+        if request_flag(request, request.data, "queue"):
+            return self._enqueue(request, uploaded_image)
 
         try:
-            # Save the uploaded image to our temp file
-            with open(temp_file_path, "wb") as f:
-                for chunk in uploaded_image.chunks():
-                    f.write(chunk)
-
-            logger.info(f"Image saved temporarily at: {temp_file_path}")
-
-            # Call PlantNet API using our temp file
-            url = "https://my-api.plantnet.org/v2/identify/all"
-            api_key = settings.PLANTNET_API_KEY
-
-            if not api_key:
-                logger.error("PlantNet API key not found in settings")
-                # Clean up temp file before returning error
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-                return Response(
-                    {"error": "PlantNet API key not configured"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
-
-            logger.info(f"Calling PlantNet API with image: {temp_file_path}")
-            with open(temp_file_path, "rb") as image_file:
-                files = {"images": image_file}
-                params = {"api-key": api_key}
-                response = requests.post(url, files=files, params=params)
-
-                logger.info(f"PlantNet API response status: {response.status_code}")
-                if response.status_code == 200:
-                    plantnet_data = response.json()
-                    logger.info("Successfully received PlantNet data")
-
-                    # Extract PlantNet results
-                    best_match_scientific = plantnet_data.get("bestMatch")
-                    results = plantnet_data.get("results", [])
-
-                    if not results:
-                        logger.warning("No results found in PlantNet response")
-                        return Response(
-                            {"error": "No plant matches found"},
-                            status=status.HTTP_404_NOT_FOUND,
-                        )
-
-                    extracted_results = []
-                    first_result_common_names = []
-                    first_result_scientific_name = None
-
-                    for i, result in enumerate(results):
-                        species_data = result.get("species", {})
-                        common_names = species_data.get("commonNames", [])
-                        scientific_name = species_data.get("scientificNameWithoutAuthor") # Often cleaner than scientificName
-                        if not scientific_name:
-                           scientific_name = species_data.get("scientificName") # Fallback
-                        score = result.get("score")
-
-                        if i == 0: # Store details of the top result
-                            first_result_common_names = common_names
-                            first_result_scientific_name = scientific_name
-
-                        extracted_result = {
-                            "scientific_name": scientific_name,
-                            "common_names": common_names,
-                            "score": score,
-                        }
-                        extracted_results.append(extracted_result)
-
-                    # --- Determine the best name to use for search links ---
-                    # Prioritize common name if available, otherwise use scientific name
-                    plant_name_for_search = None
-                    if first_result_common_names:
-                        plant_name_for_search = first_result_common_names[0] # Use the first common name
-                    elif best_match_scientific:
-                         plant_name_for_search = best_match_scientific
-                    elif first_result_scientific_name:
-                        plant_name_for_search = first_result_scientific_name
-
-                    if plant_name_for_search:
-                        logger.info(f"Using '{plant_name_for_search}' for purchase links.")
-                        # --- Generate Purchase Links ---
-                        encoded_plant_name = urllib.parse.quote_plus(plant_name_for_search)
-                        purchase_links = [
-                            {
-                                "site_name": "Google Shopping",
-                                "url": f"https://www.google.com/search?tbm=shop&q={encoded_plant_name}"
-                            },
-                            {
-                                "site_name": "Amazon",
-                                "url": f"https://www.amazon.in/s?k={encoded_plant_name}"
-                            },
-                            {
-                                "site_name": "Etsy",
-                                "url": f"https://www.etsy.com/search?q={encoded_plant_name}"
-                            },
-                            # Add more sites if desired
-                        ]
-                        # --- End Generate Purchase Links ---
-                    else:
-                        logger.warning("Could not determine a suitable plant name for search links.")
-                        purchase_links = [] # Return empty list if no name found
-
-
-                    # Prepare response data
-                    response_data = {
-                        "best_match_scientific_name": first_result_scientific_name or best_match_scientific,
-                        "best_match_common_names": ", ".join(first_result_common_names),
-                        "results": { 
-                            "best_match": best_match_scientific,
-                            "results": extracted_results,
-                         },
-                         "purchase_links": purchase_links 
-                    }
-
-
-                    return Response(response_data, status=status.HTTP_200_OK)
-
-                else:
-                    # Handle PlantNet API error
-                    try:
-                        error_data = response.json()
-                        error_message = error_data.get("message", response.text)
-                    except ValueError:
-                        error_message = response.text
-
-                    logger.error(f"PlantNet API error: {error_message}")
-                    return Response(
-                        {
-                            "error": "Bad Request to PlantNet API",
-                            "details": error_message,
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-        except requests.exceptions.RequestException as e:
-            # Handle network errors
-            logger.error(f"Network error: {str(e)}")
-            return Response(
-                {"error": f"Network error: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
+            options = shape_options(request, request.data)
+            response_data, cache_status = identify_upload(uploaded_image, request.data.get("organ"))
+        except ServiceError as e:
+            return Response(e.payload, status=e.status_code, headers=e.headers)
         except Exception as e:
             # Handle unexpected errors
             logger.error(f"Unexpected error: {str(e)}", exc_info=True)
@@ -198,24 +109,102 @@ class IdentifyPlantView(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        finally:
-            # Clean up resources in finally block
-            try:
-                # Clean up the temp directory
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-                    logger.info(f"Deleted temporary directory: {temp_dir}")
-            except Exception as cleanup_error:
-                logger.warning(f"Cleanup error (non-fatal): {str(cleanup_error)}")
+        record_identification(uploaded_image, response_data)
+
+        # Look up details for the top match right away when asked to
+        include_details = request_flag(request, request.data, "include_details")
+        if include_details and wants_stream(request, request.data):
+            response = sse_response(shape_events(describe_events(response_data), options))
+        else:
+            response_data = shape_identification(describe(response_data, include_details), **options)
+            response = Response(response_data, status=status.HTTP_200_OK)
+        if cache_status:
+            response["X-Cache"] = cache_status
+        return response
+
+    def _enqueue(self, request, uploaded_image):
+        callback_url = request.data.get("callback_url")
+        try:
+            check_callback_url(callback_url)
+        except ServiceError as e:
+            return Response(e.payload, status=e.status_code)
+
+        plant = enqueue_identification(uploaded_image, callback_url)
+        status_url = request.build_absolute_uri(
+            reverse("identify-status", kwargs={"pk": plant.pk})
+        )
+        return Response(
+            {"id": plant.id, "status": plant.status, "status_url": status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": status_url},
+        )
+
+    @action(detail=True, methods=["get"], url_path="status", url_name="status")
+    def job_status(self, request, pk=None):
+        """Progress of a queued identification, with the result once it is done"""
+        try:
+            options = shape_options(request, request.query_params)
+        except ServiceError as e:
+            return Response(e.payload, status=e.status_code)
+        payload = job_payload(self.get_object())
+        if "result" in payload:
+            payload["result"] = shape_identification(payload["result"], **options)
+        return Response(payload, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """Identify many images, or multi-organ sets of one plant, in one request"""
+        with metrics.timed("upload_parse"):
+            items = parse_batch(request.FILES, request.data)
+        if not items:
+            return Response(
+                {"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        image_count = sum(len(images) for _, images, _ in items)
+        if image_count > settings.IDENTIFY_BATCH_MAX_IMAGES:
+            return Response(
+                {"error": f"Too many images: {image_count} (limit {settings.IDENTIFY_BATCH_MAX_IMAGES})"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            options = shape_options(request, request.data)
+        except ServiceError as e:
+            return Response(e.payload, status=e.status_code)
+
+        logger.info(f"Identifying batch of {len(items)} items ({image_count} images)")
+        results = identify_batch(items)
+        for item in results:
+            if "result" in item:
+                item["result"] = shape_identification(item["result"], **options)
+        return Response({"count": len(results), "results": results}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"], url_path="cache-stats")
+    def cache_stats(self, request):
+        """Hit/miss counters for the identification cache in this process"""
+        cache = get_identification_cache()
+        if not cache:
+            return Response({"enabled": False}, status=status.HTTP_200_OK)
+        return Response({"enabled": True, **cache.stats()}, status=status.HTTP_200_OK)
 
 
 class PlantDetailsView(APIView):
     """
-    API endpoint for getting detailed information about a plant from GROQ
-    (No changes needed in this view)
+    API endpoint for getting detailed information about a plant from GROQ.
+    Send "stream": true (or Accept: text/event-stream) to receive the answer
+    as server-sent events while it is generated. GET with ?plant_name= is
+    cacheable: answers carry an ETag and Cache-Control, and a matching
+    If-None-Match gets 304.
     """
+    def get(self, request, format=None):
+        return self._details(request, request.query_params)
+
     def post(self, request, format=None):
-        plant_name = request.data.get("plant_name")
+        return self._details(request, request.data)
+
+    def _details(self, request, data):
+        plant_name = data.get("plant_name")
 
         if not plant_name:
             return Response(
@@ -224,56 +213,67 @@ class PlantDetailsView(APIView):
 
         logger.info(f"Received request for plant details: {plant_name}")
 
-        try:
-            # Check for GROQ API key
-            groq_api_key = settings.GROQ_API_KEY
-            if not groq_api_key:
-                logger.error("GROQ API key not found in settings")
-                return Response(
-                    {"error": "GROQ API key not configured"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
-
-            logger.info(f"Calling GROQ API for details about {plant_name}")
-            from groq import Groq
-
-            client = Groq(api_key=groq_api_key)
-
-            completion = client.chat.completions.create(
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a plant instructor in an app called FLORA. You'll be provided with the name of a specific plant. Provide information in these categories: 'introduction' (brief overview), 'history' (origins and cultural significance), 'facts' (list of interesting facts as an array), and 'usage' (list of ways the plant is used as an array). Answer in JSON format only.",
-                    },
-                    {"role": "user", "content": f"Tell me about {plant_name}"},
-                ],
-                temperature=1,
-                max_tokens=1024,
-                top_p=1,
-                response_format={"type": "json_object"},
-            )
-
-            groq_data = completion.choices[0].message.content
-            logger.info("Successfully received GROQ data")
-
-            # Parse the GROQ response to ensure it's valid JSON
+        if wants_stream(request, data):
             try:
-                parsed_data = json.loads(groq_data)
-                return Response(parsed_data, status=status.HTTP_200_OK)
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON in GROQ response: {groq_data}")
-                return Response(
-                    {
-                        "error": "Invalid response format from GROQ API",
-                        "raw_response": groq_data,
-                    },
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
+                return sse_response(stream_plant_details(plant_name))
+            except ServiceError as e:
+                return Response(e.payload, status=e.status_code, headers=e.headers)
 
+        try:
+            parsed_data, cache_status = get_plant_details(plant_name)
+        except ServiceError as e:
+            return Response(e.payload, status=e.status_code, headers=e.headers)
         except Exception as e:
             logger.error(f"Error getting plant details: {str(e)}", exc_info=True)
             return Response(
                 {"error": f"Failed to get plant details: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
\ No newline at end of file
+            )
+
+        parsed_data = shape_details(parsed_data, requested_fields(request, data))
+        etag = details_etag(parsed_data)
+        response = not_modified(request, etag) or Response(parsed_data, status=status.HTTP_200_OK)
+        if cache_status:
+            response["X-Cache"] = cache_status
+        return add_details_cache_headers(response, etag)
+
+
+class UpstreamStatsView(APIView):
+    """Rate-limit and circuit-breaker counters for PlantNet and GROQ in this process"""
+    def get(self, request, format=None):
+        return Response(upstream_stats(), status=status.HTTP_200_OK)
+
+
+class SpeciesSearchView(APIView):
+    """
+    Species name lookups. ?q= autocompletes on scientific names, common names
+    and synonyms; ?name= resolves one name to its species.
+    """
+    def get(self, request, format=None):
+        index = get_species_index()
+        if not index:
+            return Response(
+                {"error": "Species index not available"}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        name = request.query_params.get("name")
+        if name:
+            species = index.resolve(name)
+            if not species:
+                return Response({"error": "Unknown plant name"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(species, status=status.HTTP_200_OK)
+
+        query = request.query_params.get("q", "")
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), settings.SPECIES_SEARCH_MAX_RESULTS)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        results = index.search(query, max(limit, 1))
+        return Response({"count": len(results), "results": results}, status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process's metrics"""
+    if not metrics.enabled():
+        raise Http404
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
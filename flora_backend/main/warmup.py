@@ -0,0 +1,195 @@
+# main/warmup.py
+
+"""
+Per-process warm-up. The heavy objects behind the API (the URLconf, the
+GROQ SDK and its client, the PlantNet session, the species index, the
+caches, Pillow's image plugins) are built on first use, so without this the
+first request each worker serves pays for all of them. wsgi.py and asgi.py
+call warm_up() when WARM_UP is on; both are imported in every worker after
+the fork, so each process gets its own connections. Under ASGI,
+lifespan_warm_up also builds the loop-bound async clients on the server's
+event loop before it accepts requests.
+"""
+
+import logging
+import threading
+import time
+import typing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_warmed = set()
+_warm_lock = threading.Lock()
+
+
+def _urls():
+    # Django loads the URLconf, and with it the views and serializers, on the first request
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+
+
+def _groq_models():
+    # pydantic builds each response model's schema when the first completion is parsed
+    from groq.types.chat import ChatCompletion, ChatCompletionChunk
+    from pydantic import BaseModel
+
+    pending, seen = [ChatCompletion, ChatCompletionChunk], set()
+    while pending:
+        annotation = pending.pop()
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            if annotation not in seen:
+                seen.add(annotation)
+                annotation.model_rebuild()
+                pending.extend(field.annotation for field in annotation.model_fields.values())
+        else:
+            pending.extend(typing.get_args(annotation))
+
+
+def _groq_client():
+    from .services import get_groq_client
+
+    if settings.GROQ_API_KEY:
+        # The SDK imports its chat resources on first access
+        get_groq_client().chat.completions
+        _groq_models()
+
+
+def _groq_sdk():
+    # Async clients are per event loop; the SDK's modules and models are what they share
+    import groq.resources.chat  # noqa: F401
+    import httpx  # noqa: F401
+
+    if settings.GROQ_API_KEY:
+        _groq_models()
+
+
+def _plantnet_client():
+    from .plantnet import get_plantnet_client
+    from .services import get_identification_backends, groq_governor, plantnet_governor
+
+    get_plantnet_client()
+    get_identification_backends()
+    plantnet_governor()
+    groq_governor()
+
+
+def _species_index():
+    from .species import get_species_index
+
+    get_species_index()
+
+
+def _caches():
+    from .cache import get_details_cache, get_identification_cache
+
+    get_identification_cache()
+    get_details_cache()
+
+
+def _images():
+    from PIL import Image
+
+    Image.init()
+
+
+def _database():
+    # One query loads the ORM's SQL compiler and opens the pool when DB_POOL is on;
+    # a plain connection is per thread, so close it
+    from .models import PlantDetails
+
+    try:
+        PlantDetails.objects.filter(pk=0).exists()
+    finally:
+        connection.close()
+
+
+SYNC_COMPONENTS = {
+    "urls": _urls,
+    "groq": _groq_client,
+    "plantnet": _plantnet_client,
+    "species_index": _species_index,
+    "caches": _caches,
+    "images": _images,
+    "database": _database,
+}
+ASYNC_COMPONENTS = {
+    "urls": _urls,
+    "groq_sdk": _groq_sdk,
+    "plantnet": _plantnet_client,
+    "species_index": _species_index,
+    "caches": _caches,
+    "images": _images,
+    "database": _database,
+}
+
+
+def warm_up(asynchronous=False):
+    """
+    Build this process's clients, caches and indexes ahead of the first
+    request. Runs each component once per process, never raises, and
+    returns the seconds spent per component.
+    """
+    components = ASYNC_COMPONENTS if asynchronous else SYNC_COMPONENTS
+    timings = {}
+    with _warm_lock:
+        for name, warm in components.items():
+            if name in _warmed:
+                continue
+            started = time.perf_counter()
+            try:
+                warm()
+            except Exception as e:
+                logger.warning(f"Warm-up of {name} failed: {str(e)}")
+            _warmed.add(name)
+            timings[name] = time.perf_counter() - started
+    if timings:
+        summary = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items())
+        logger.info(f"Warmed up in {sum(timings.values()) * 1000:.0f}ms: {summary}")
+    return timings
+
+
+async def awarm_up():
+    """warm_up for the async stack, plus the async clients bound to the running loop"""
+    timings = await sync_to_async(warm_up)(asynchronous=True)
+    from .plantnet import get_async_plantnet_client
+    from .services import get_async_groq_client
+
+    started = time.perf_counter()
+    try:
+        import anyio
+
+        # httpx's async transport loads anyio's asyncio backend on its first connection
+        await anyio.sleep(0)
+        get_async_plantnet_client()
+        if settings.GROQ_API_KEY:
+            get_async_groq_client().chat.completions
+    except Exception as e:
+        logger.warning(f"Warm-up of async clients failed: {str(e)}")
+    timings["async_clients"] = time.perf_counter() - started
+    return timings
+
+
+def lifespan_warm_up(application):
+    """
+    Wrap an ASGI application to answer the lifespan protocol (which Django
+    rejects) and run awarm_up on the server's event loop at startup.
+    """
+
+    async def lifespan(scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await awarm_up()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    return lifespan